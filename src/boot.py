@@ -1,6 +1,10 @@
 import board
 import storage
 import digitalio
+import usb_cdc
+
+# second serial port for tools/euclidlink.py, next to the console
+usb_cdc.enable(console=True, data=True)
 
 switch = digitalio.DigitalInOut(board.GP21)  # btn 1
 switch.switch_to_input(pull=digitalio.Pull.UP)  # default HIGH / True
@@ -8,5 +12,6 @@ readonly = not switch.value
 
 # filesystem is available for board or host, not both
 # readonly from CircuitPython perspective, write enabled for host.
+# tools/euclidlink.py reads and writes sequences and packs without this.
 print(f"CircuitPython {readonly=}.")
 storage.remount("/", readonly=readonly)
@@ -0,0 +1,345 @@
+"""Binary protocol on the USB CDC data port, for tools/euclidlink.py.
+
+Every request is one frame: SYNC, command, payload length (2 bytes,
+little endian), payload and a CRC-8 (store.crc8) of everything after SYNC.
+The reply is a frame with the same command, its payload a status byte and
+the data. Multi-byte integers are little endian.
+
+    INFO         -                        version, channels, slots, steps, max payload (2)
+    READ_SLOTS   first, count             first, count, count records
+    WRITE_SLOTS  first, count, records    first, count
+    GET_STATE    -                        playing, slot, next slot, milli-BPM (4), swing,
+                                          nudge per voice, ratchets per voice,
+                                          chain length, (slot, bars) pairs, pack name
+    SET_TEMPO    milli-BPM (4)            -
+    SET_GROOVE   swing, nudge per voice, ratchets per voice
+    SELECT_SLOT  slot                     -   (switches at the next step 0 while playing)
+    SET_CHAIN    (slot, bars) pairs       -   (none goes back to single slots)
+    TRANSPORT    1 play / 0 stop          -
+    LIST_PACKS   -                        pack names, one per line
+    READ_FILE    offset (4), "pack/file"  file size (4), up to MAX_PAYLOAD - 5 bytes from offset
+    WRITE_FILE   offset (4), path length, "pack/file", data
+                                          end offset (4), offset 0 starts the file over
+    SWAP_PACK    pack name                -
+
+A slot record is the store's data: a flags byte (store.USED or 0 for an
+empty slot), then hits, offsets and lengths per voice. Slots are written
+to the store one per poll(), the reply goes out after the last one.
+Files are the ones of the sample packs, manifest.json included; files of
+the pack playing or loading can't be written.
+"""
+import os
+
+from adafruit_ticks import ticks_ms, ticks_diff
+
+try:
+    import usb_cdc
+except ImportError:
+    usb_cdc = None
+
+import event
+import store
+from sequencer import MAX_SEQUENCES
+
+VERSION = 1
+SYNC = 0xE5
+HEADER = 4  # sync, command, payload length
+MAX_PAYLOAD = 512
+FRAME_TIMEOUT_MS = 500  # a frame cut off for this long is dropped
+REPLY_TIMEOUT = 0.01  # seconds a reply may wait for the host, so a closed port can't stall the loop
+
+# commands
+INFO = 1
+READ_SLOTS = 2
+WRITE_SLOTS = 3
+GET_STATE = 4
+SET_TEMPO = 5
+SET_GROOVE = 6
+SELECT_SLOT = 7
+SET_CHAIN = 8
+TRANSPORT = 9
+LIST_PACKS = 10
+READ_FILE = 11
+WRITE_FILE = 12
+SWAP_PACK = 13
+
+# reply status, errors carry a message
+OK = 0
+BAD_FRAME = 1
+UNKNOWN = 2
+BAD_REQUEST = 3
+FILE_ERROR = 4
+
+
+class DataLink(event.EventEmitter):
+    """Serves the protocol above while the sequencer plays.
+
+    poll() reads what arrived without waiting and handles at most one
+    command, call it when the next step is far enough away. Emits
+    CDC_COMMAND for every command handled.
+    """
+
+    def __init__(self, seq, samples=None, midi=None, port=None):
+        super().__init__()
+        self.seq = seq
+        self.samples = samples
+        self.midi = midi
+        self.port = port if port is not None or usb_cdc is None else usb_cdc.data  # None unless boot.py enabled it
+        if self.port is not None:
+            self.port.timeout = 0
+            self.port.write_timeout = REPLY_TIMEOUT
+        self.record_size = 1 + 3 * seq.channels
+        self.commands = 0
+        self.errors = 0
+        self._buf = bytearray(HEADER + MAX_PAYLOAD + 1)
+        self._mv = memoryview(self._buf)
+        self._have = 0  # bytes of the frame read so far
+        self._need = HEADER  # bytes of the frame to read
+        self._started = 0  # ticks_ms() the frame started
+        self._writes = None  # [first, count, done] of WRITE_SLOTS records still in _buf
+        self._handlers = {
+            INFO: self._info,
+            READ_SLOTS: self._read_slots,
+            WRITE_SLOTS: self._write_slots,
+            GET_STATE: self._get_state,
+            SET_TEMPO: self._set_tempo,
+            SET_GROOVE: self._set_groove,
+            SELECT_SLOT: self._select_slot,
+            SET_CHAIN: self._set_chain,
+            TRANSPORT: self._transport,
+            LIST_PACKS: self._list_packs,
+            READ_FILE: self._read_file,
+            WRITE_FILE: self._write_file,
+            SWAP_PACK: self._swap_pack,
+        }
+
+    def poll(self):
+        if self._writes is not None:
+            self._write_next_slot()
+            return
+        port = self.port
+        if port is None:
+            return
+        if not port.in_waiting:
+            if self._have and ticks_diff(ticks_ms(), self._started) > FRAME_TIMEOUT_MS:
+                self._have, self._need = 0, HEADER
+                self.errors += 1
+            return
+
+        buf = self._buf
+        if not self._have:
+            self._started = ticks_ms()
+        have = self._have + port.readinto(self._mv[self._have:self._need])
+        if buf[0] != SYNC:
+            # out of step with the host, drop everything up to the next SYNC
+            start = 1
+            while start < have and buf[start] != SYNC:
+                start += 1
+            buf[:have - start] = buf[start:have]
+            have -= start
+        self._have = have
+
+        if self._need == HEADER and have >= HEADER:
+            length = buf[2] | buf[3] << 8
+            if length > MAX_PAYLOAD:
+                self._have = 0
+                self.errors += 1
+                self._reply(buf[1], BAD_FRAME, f"payload over {MAX_PAYLOAD} bytes".encode())
+                return
+            self._need = HEADER + length + 1
+        if self._need > HEADER and have >= self._need:
+            self._dispatch()
+
+    def _dispatch(self):
+        buf, end = self._buf, self._need - 1
+        command = buf[1]
+        self._have, self._need = 0, HEADER
+        if store.crc8(self._mv[1:end]) != buf[end]:
+            self.errors += 1
+            self._reply(command, BAD_FRAME, b"CRC mismatch")
+            return
+        handler = self._handlers.get(command)
+        if handler is None:
+            self._reply(command, UNKNOWN, f"unknown command {command}".encode())
+            return
+
+        self.commands += 1
+        try:
+            data = handler(self._mv[HEADER:end])
+        except (ValueError, IndexError, KeyError) as e:
+            self._reply(command, BAD_REQUEST, str(e).encode())
+        except OSError as e:
+            self._reply(command, FILE_ERROR, str(e).encode())
+        else:
+            if data is not None:  # None: replied to later
+                self._reply(command, OK, data)
+        self.emit(event.CDC_COMMAND, command)
+
+    def _reply(self, command, status, data=b""):
+        frame = bytes((SYNC, command)) + (len(data) + 1).to_bytes(2, "little") + bytes((status,)) + data
+        self.port.write(frame + bytes((store.crc8(memoryview(frame)[1:]),)))
+
+    def _slots(self, first, count):
+        if count < 1 or first + count > MAX_SEQUENCES:
+            raise ValueError(f"slots {first}..{first + count - 1} out of 0..{MAX_SEQUENCES - 1}")
+        if 2 + count * self.record_size > MAX_PAYLOAD - 1:
+            raise ValueError(f"at most {(MAX_PAYLOAD - 3) // self.record_size} slots per frame")
+
+    def _info(self, payload):
+        seq = self.seq
+        return bytes((VERSION, seq.channels, MAX_SEQUENCES, seq.step_count)) + MAX_PAYLOAD.to_bytes(2, "little")
+
+    def _read_slots(self, payload):
+        first, count = payload[0], payload[1]
+        self._slots(first, count)
+        out = bytearray((first, count))
+        for idx in range(first, first + count):
+            sequence = self.seq.sequences[idx]
+            if sequence is None:
+                out.extend(bytes(self.record_size))
+            else:
+                out.append(store.USED)
+                for values in sequence:
+                    out.extend(values)
+        return out
+
+    def _write_slots(self, payload):
+        first, count = payload[0], payload[1]
+        self._slots(first, count)
+        if len(payload) != 2 + count * self.record_size:
+            raise ValueError(f"{count} records are {count * self.record_size} bytes")
+        ch, steps = self.seq.channels, self.seq.step_count
+        for idx in range(count):
+            at = 2 + idx * self.record_size
+            record = payload[at:at + self.record_size]
+            hits, offsets, lengths = record[1:1 + ch], record[1 + ch:1 + 2 * ch], record[1 + 2 * ch:]
+            if max(hits) > steps or max(offsets) >= steps or max(lengths) > steps:
+                raise ValueError(f"slot {first + idx}: values over {steps} steps")
+        self._writes = [first, count, 0]
+        return None
+
+    def _write_next_slot(self):
+        first, count, done = self._writes
+        ch = self.seq.channels
+        at = HEADER + 2 + done * self.record_size
+        record = self._buf[at:at + self.record_size]
+        sequence = None
+        if record[0] & store.USED:
+            sequence = bytearray(record[1:1 + ch]), bytearray(record[1 + ch:1 + 2 * ch]), bytearray(record[1 + 2 * ch:])
+        if not self.seq.write_sequence(first + done, sequence):
+            self._writes = None
+            self._reply(WRITE_SLOTS, FILE_ERROR, b"store is read only, see boot.py")
+            return
+        self._writes[2] = done = done + 1
+        if done == count:
+            self._writes = None
+            self._reply(WRITE_SLOTS, OK, bytes((first, count)))
+
+    def _get_state(self, payload):
+        seq = self.seq
+        out = bytearray((seq.playing, seq.sequence_idx, seq.next_sequence_idx))
+        out.extend(round(seq.tempo * 1000).to_bytes(4, "little"))
+        out.append(seq.swing)
+        out.extend(seq.nudge)
+        out.extend(seq.ratchets)
+        chain = seq.chain or ()
+        out.append(len(chain))
+        for slot, bars in chain:
+            out.append(slot)
+            out.append(bars)
+        if self.samples is not None and self.samples.pack:
+            out.extend(self.samples.pack.encode())
+        return out
+
+    def _set_tempo(self, payload):
+        milli = int.from_bytes(payload[:4], "little")
+        if not 1000 <= milli <= 999_000:
+            raise ValueError("tempo out of 1..999 BPM")
+        self.seq.set_tempo(milli // 1000 if milli % 1000 == 0 else milli / 1000)
+        return b""
+
+    def _set_groove(self, payload):
+        seq, ch = self.seq, self.seq.channels
+        if len(payload) != 1 + 2 * ch:
+            raise ValueError(f"swing and {ch} nudges and ratchets expected")
+        seq.set_swing(payload[0])
+        for voice in range(ch):
+            seq.set_nudge(voice, payload[1 + voice])
+            seq.set_ratchet(voice, payload[1 + ch + voice])
+        return b""
+
+    def _select_slot(self, payload):
+        slot = payload[0]
+        if slot >= MAX_SEQUENCES:
+            raise ValueError(f"slot {slot} out of 0..{MAX_SEQUENCES - 1}")
+        self.seq.schedule_sequence(slot - self.seq.next_sequence_idx)
+        return b""
+
+    def _set_chain(self, payload):
+        chain = [(payload[idx], payload[idx + 1]) for idx in range(0, len(payload) - 1, 2)]
+        if any(slot >= MAX_SEQUENCES or not bars for slot, bars in chain):
+            raise ValueError("chain entries are (slot, bars) with bars over 0")
+        self.seq.set_chain(chain)
+        return b""
+
+    def _transport(self, payload):
+        seq = self.seq
+        if payload[0] and not seq.playing:
+            seq.play()
+        elif not payload[0] and seq.playing:
+            seq.stop()
+            if self.midi is not None:
+                self.midi.release()
+        return b""
+
+    def _pack_path(self, path):
+        """Path of a pack file from "pack/file", nothing outside the packs"""
+        if self.samples is None:
+            raise ValueError("no sample packs")
+        pack, _, filename = path.partition("/")
+        for part in (pack, filename):
+            if not part or part[0] == "." or "/" in part:
+                raise ValueError(f"{path}: not a pack/file name")
+        return pack, f"{self.samples.folder}/{pack}/{filename}"
+
+    def _list_packs(self, payload):
+        if self.samples is None:
+            return b""
+        return "\n".join(self.samples.packs()).encode()
+
+    def _read_file(self, payload):
+        offset = int.from_bytes(payload[:4], "little")
+        _, path = self._pack_path(bytes(payload[4:]).decode())
+        size = os.stat(path)[6]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(MAX_PAYLOAD - 5)
+        return size.to_bytes(4, "little") + data
+
+    def _write_file(self, payload):
+        offset = int.from_bytes(payload[:4], "little")
+        end = 5 + payload[4]
+        pack, path = self._pack_path(bytes(payload[5:end]).decode())
+        if pack == self.samples.active_pack:
+            raise ValueError(f"{pack} is playing, swap to another pack first")
+        if pack == self.samples.pack:
+            raise ValueError(f"{pack} is loading, swap to another pack first")
+        if offset:
+            f = open(path, "r+b")
+            f.seek(offset)
+        else:
+            try:
+                os.mkdir(f"{self.samples.folder}/{pack}")
+            except OSError:
+                pass  # already there
+            f = open(path, "wb")
+        with f:
+            f.write(payload[end:])
+        self.samples.forget(pack)
+        return (offset + len(payload) - end).to_bytes(4, "little")
+
+    def _swap_pack(self, payload):
+        if self.samples is None:
+            raise ValueError("no sample packs")
+        self.samples.swap(bytes(payload).decode())
+        return b""
@@ -0,0 +1,67 @@
+from adafruit_ticks import ticks_ms, ticks_diff
+
+FRAME_MS = 16  # poll() applies edits at most this often, like the display refresh
+
+HITS = 0
+OFFSETS = 1
+LENGTHS = 2
+
+
+class EditQueue:
+    """Encoder edits summed per voice and parameter, applied in one go by flush().
+
+    Subscribe hits()/offsets()/lengths() to the UI value change events in
+    place of the sequencer, and call flush() once per display frame, away
+    from the steps, or poll() from a loop that runs faster than that.
+    However many loop passes an encoder turn spans, every voice and
+    parameter is recalculated once per frame, with the sum of its deltas.
+    Nothing is allocated until flush() applies them.
+
+    Subscribe flush() ahead of the sequencer to whatever reads or replaces
+    the patterns (save, schedule, reset, randomize), so pending edits land
+    where they were made.
+    """
+
+    def __init__(self, seq, tracks, frame_ms=FRAME_MS):
+        self.frame_ms = frame_ms
+        self._flushed_at = ticks_ms()
+        self._pending = tuple([0] * tracks for _ in range(3))  # delta per parameter, per voice
+        self._apply = (seq.update_hits, seq.update_offsets, seq.update_lengths)
+        self._dirty = False
+        self.edits = 0  # deltas received
+        self.applied = 0  # recalculations they turned into
+
+    def hits(self, ch, delta):
+        self._pending[HITS][ch] += delta
+        self._dirty = True
+        self.edits += 1
+
+    def offsets(self, ch, delta):
+        self._pending[OFFSETS][ch] += delta
+        self._dirty = True
+        self.edits += 1
+
+    def lengths(self, ch, delta):
+        self._pending[LENGTHS][ch] += delta
+        self._dirty = True
+        self.edits += 1
+
+    def poll(self):
+        """flush() if the last one was at least frame_ms ago"""
+        if self._dirty and ticks_diff(ticks_ms(), self._flushed_at) >= self.frame_ms:
+            self.flush()
+
+    def flush(self, *args):
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._flushed_at = ticks_ms()
+        for param in range(3):
+            pending = self._pending[param]
+            apply = self._apply[param]
+            for ch in range(len(pending)):
+                delta = pending[ch]
+                if delta:
+                    pending[ch] = 0
+                    apply(ch, delta)
+                    self.applied += 1
@@ -1,3 +1,12 @@
+from time import monotonic_ns
+
+try:
+    from gc import mem_alloc
+except ImportError:
+    mem_alloc = None  # plain Python, no allocation stats
+
+import tracebuf
+
 UI_PLAY_STOP = 0
 UI_ENCODER_CHANGED = 1
 UI_HITS_VALUE_CHANGE = 2
@@ -20,18 +29,129 @@ SEQ_STEP_TRIGGER_CHANNELS = 17  # [ch1, ch2, ch3...] where chX is a value 0/1 if
 SEQ_ACTIVE_STEP = 18
 SEQ_TEMPO_CHANGE = 19
 SEQ_PATTERN_CHANGE = 20
-SEQ_STEP_TRIGGER_MIDI = 21
+SEQ_STEP_TRIGGER_MIDI = 21  # (notes) every step, (notes, True) for sub-steps in between
 SEQ_SEQUENCE_SELECT = 22
 SEQ_SEQUENCE_SAVING = 23
 
+MIDI_CLOCK = 24  # (now) 24 PPQN clock tick
+MIDI_START = 25
+MIDI_CONTINUE = 26
+MIDI_STOP = 27
+MIDI_SONG_POSITION = 28  # (position) in 16th notes
+
+CDC_COMMAND = 29  # (command) handled from the USB data port, see cdc.py
+
+EVENT_COUNT = 30  # keep above the highest event id
+
+INSTRUMENT = False  # default for EventEmitter.compile()
+TRACE = False  # default for EventEmitter.compile()
+
+_NO_ARG = object()  # compiled emit takes up to two arguments, without packing them
+
+
+def event_name(event):
+    for name, value in globals().items():
+        if value == event and name[:3] in ("UI_", "SEQ", "MID", "CDC"):
+            return name
+    return str(event)
+
 
 class EventEmitter:
     def __init__(self):
         self._subscribers = {}
+        self._table = None
+        self._counts = None
+        self._handler_ns = None
+        self._handler_bytes = None
+        self._traced = False
 
     def register(self, event, callback):
         self._subscribers.setdefault(event, []).append(callback)
+        if self._table is not None:
+            self.compile(self._counts is not None, self._traced)
     
     def emit(self, event, *args):
         for fn in self._subscribers.get(event, []):
             fn(*args)
+
+    def compile(self, instrument=None, trace=None):
+        """Freeze subscribers into a tuple indexed by event id. Call it once
+        wiring is done, registering afterwards recompiles.
+
+        The compiled emit passes at most two arguments and doesn't pack them
+        into a tuple, so emitting allocates nothing. With instrument, every
+        emit counts calls, handler time and bytes allocated per subscriber,
+        see stats(). With trace, every emit leaves a tracebuf.EVENT record.
+        """
+        if instrument is None:
+            instrument = INSTRUMENT
+        if trace is None:
+            trace = TRACE
+        self._traced = trace
+        size = max(list(self._subscribers) + [EVENT_COUNT - 1]) + 1
+        self._table = tuple(tuple(self._subscribers.get(e, ())) for e in range(size))
+
+        if instrument:
+            self._counts = [0] * size
+            self._handler_ns = [[0] * len(fns) for fns in self._table]
+            self._handler_bytes = [[0] * len(fns) for fns in self._table]
+            self.emit = self._emit_instrumented
+        elif trace:
+            self._counts = self._handler_ns = self._handler_bytes = None
+            self.emit = self._emit_traced
+        else:
+            self._counts = self._handler_ns = self._handler_bytes = None
+            self.emit = self._emit_compiled
+
+    def _emit_compiled(self, event, a=_NO_ARG, b=_NO_ARG):
+        if a is _NO_ARG:
+            for fn in self._table[event]:
+                fn()
+        elif b is _NO_ARG:
+            for fn in self._table[event]:
+                fn(a)
+        else:
+            for fn in self._table[event]:
+                fn(a, b)
+
+    def _emit_traced(self, event, a=_NO_ARG, b=_NO_ARG):
+        tracebuf.log(tracebuf.EVENT, event, a if type(a) is int else 0, tracebuf.DEBUG)
+        self._emit_compiled(event, a, b)
+
+    def _emit_instrumented(self, event, a=_NO_ARG, b=_NO_ARG):
+        if self._traced:
+            tracebuf.log(tracebuf.EVENT, event, a if type(a) is int else 0, tracebuf.DEBUG)
+        self._counts[event] += 1
+        handler_ns = self._handler_ns[event]
+        handler_bytes = self._handler_bytes[event]
+        for idx, fn in enumerate(self._table[event]):
+            start = monotonic_ns()
+            allocated = mem_alloc() if mem_alloc else 0
+            if a is _NO_ARG:
+                fn()
+            elif b is _NO_ARG:
+                fn(a)
+            else:
+                fn(a, b)
+            if mem_alloc:
+                # read before the clock, whose ns ints are heap allocated on the device
+                allocated = mem_alloc() - allocated
+                handler_bytes[idx] += allocated if allocated > 0 else 0  # negative when collected
+            handler_ns[idx] += monotonic_ns() - start
+
+    def stats(self):
+        """[(event name, subscriber name, emits, total handler us, bytes allocated)], slowest first"""
+        if self._counts is None:
+            return []
+        rows = []
+        for event, fns in enumerate(self._table):
+            for idx, fn in enumerate(fns):
+                name = getattr(fn, "__name__", None) or repr(fn)
+                rows.append((event_name(event), name, self._counts[event],
+                             self._handler_ns[event][idx] // 1000, self._handler_bytes[event][idx]))
+        rows.sort(key=lambda row: -row[3])
+        return rows
+
+    def print_stats(self):
+        for name, handler, count, total_us, allocated in self.stats():
+            print(f"{name:<28} {handler:<24} {count:>8} {total_us:>10}us {allocated:>8}B")
@@ -5,10 +5,15 @@ import digitalio
 import board
 
 from adafruit_debouncer import Debouncer
-from adafruit_ticks import ticks_ms, ticks_diff
+from adafruit_ticks import ticks_ms, ticks_diff, ticks_add
 import neopixel
 import adafruit_74hc595
 
+try:
+    import keypad
+except ImportError:
+    keypad = None
+
 import event
 
 # pullup buttons are inverted
@@ -27,18 +32,21 @@ ENCODER_PINS = (
 )
 
 ENCODER_BUTTON_PIN = board.GP26
+ENCODER_BUTTON = 4  # bit of the encoder button in the button masks, after the 4 buttons
 TEMPO_LED_PIN = board.GP22
 
 LEDS_595_SCLK = board.GP2
 LEDS_595_DATA = board.GP3
 LEDS_595_LATCH_PIN = board.GP4
 
-SYNC_CLOCK_IN = board.GP13  # assumes PPQN = 4
+SYNC_CLOCK_IN = board.GP13
+SYNC_CLOCK_IN_PPQN = 4  # pulses per quarter note, a multiple of 4 (steps are 16th notes)
 
 
 class UI(event.EventEmitter):
-    def __init__(self):
+    def __init__(self, clock_ppqn=SYNC_CLOCK_IN_PPQN, tracks=len(BUTTON_PINS)):
         super().__init__()
+        self.tracks = tracks  # voices beyond the buttons are reached in banks
         self._now = ticks_ms()
         self._last_hold_millis = ticks_ms()
 
@@ -46,6 +54,21 @@ class UI(event.EventEmitter):
         self._last_encoder_position = None
         self._encoder_delta = 0
 
+        self._setup_buttons()
+
+        self.active_voice = 0
+        self.active_menu = -1
+
+        self.clock_in = countio.Counter(SYNC_CLOCK_IN, edge=countio.Edge.RISE)
+        self._last_clock_in_count = 0
+        self._clock_pulses = 0  # pulses into the current step
+        assert clock_ppqn % 4 == 0, "sync clock PPQN must be a multiple of 4"
+        self._pulses_per_step = clock_ppqn // 4
+        self._last_pulse_millis = None
+        self._pulse_millis = 0  # time between pulses, 0 until known
+        self._last_clock_poll = self._now
+
+    def _setup_buttons(self):
         encoder_button_pin = digitalio.DigitalInOut(ENCODER_BUTTON_PIN)
         encoder_button_pin.direction = digitalio.Direction.INPUT
         encoder_button_pin.pull = digitalio.Pull.UP
@@ -59,12 +82,8 @@ class UI(event.EventEmitter):
             button = Debouncer(sw)
             self.buttons.append(button)
 
-        self.active_voice = 0
-        self.active_menu = -1
-
-        self.clock_in = countio.Counter(SYNC_CLOCK_IN, edge=countio.Edge.RISE)
-        self._last_clock_in_count = 0
-        self._clock_pulses = 0
+        # ENCODER_BUTTON is the index right after the buttons
+        self._debouncers = tuple(self.buttons) + (self.encoder_button,)
 
     def update(self):
         self._now = ticks_ms()
@@ -73,7 +92,6 @@ class UI(event.EventEmitter):
         self.sync_clock_in()
 
     def update_encoder(self):
-        self.encoder_button.update()
         position = self.encoder.position
 
         if None not in (position, self._last_encoder_position):
@@ -81,81 +99,192 @@ class UI(event.EventEmitter):
         self._last_encoder_position = position
 
     def update_buttons(self):
-        for idx, button in enumerate(self.buttons):
+        pressed = fell = rose = 0
+        for idx, button in enumerate(self._debouncers):
             button.update()
-
-            if button.pressing and self._encoder_delta:
+            bit = 1 << idx
+            if button.pressing:
+                pressed |= bit
+            if button.fell:
+                fell |= bit
+            if button.rose:
+                rose |= bit
+
+        self._handle_buttons(pressed, fell, rose, self._encoder_delta)
+
+    def _handle_buttons(self, pressed, fell, rose, encoder_delta):
+        """pressed/fell/rose: bit per button, ENCODER_BUTTON bit for the encoder button"""
+        for idx in range(len(BUTTON_PINS)):
+            bit = 1 << idx
+
+            if pressed & bit and encoder_delta:
                 if self.active_menu != idx:
                     self.active_menu = idx
 
                 # Hits
                 if idx == 0:
-                    self.emit(event.UI_HITS_VALUE_CHANGE, self.active_voice, self._encoder_delta)
+                    self.emit(event.UI_HITS_VALUE_CHANGE, self.active_voice, encoder_delta)
 
                 # Offset
                 elif idx == 1:
-                    self.emit(event.UI_OFFSET_VALUE_CHANGE, self.active_voice, self._encoder_delta)
+                    self.emit(event.UI_OFFSET_VALUE_CHANGE, self.active_voice, encoder_delta)
 
                 # Length
                 elif idx == 2:
-                    self.emit(event.UI_STEP_LENGTH_VALUE_CHANGE, self.active_voice, self._encoder_delta)
+                    self.emit(event.UI_STEP_LENGTH_VALUE_CHANGE, self.active_voice, encoder_delta)
                 
                 # Load sequence
                 elif idx == 3:
-                    self.emit(event.UI_SEQUENCE_SCHEDULE, self._encoder_delta)
+                    self.emit(event.UI_SEQUENCE_SCHEDULE, encoder_delta)
 
-            elif button.rose and self.active_menu == idx:
+            elif rose & bit and self.active_menu == idx:
                 self.active_menu = -1
 
-            # Change voice
-            elif button.rose:
-                self.active_voice = idx
+            # Change voice, pressing the active voice's button again moves to the next bank
+            elif rose & bit:
+                voice = idx
+                if self.active_voice % len(BUTTON_PINS) == idx:
+                    voice = self.active_voice + len(BUTTON_PINS)
+                    if voice >= self.tracks:
+                        voice = idx
+                self.active_voice = voice
                 self.emit(event.UI_VOICE_CHANGE, self.active_voice)
 
         # Sequences mode
-        if self.buttons[3].fell:
+        if fell & 0b1000:
             self.emit(event.UI_SEQUENCE_MODE, True)
 
-        if self.buttons[3].rose:
+        if rose & 0b1000:
             self.emit(event.UI_SEQUENCE_MODE, False)
 
         # Save sequence
-        if self.buttons[3].pressing and self.encoder_button.rose:
+        if pressed & 0b1000 and rose & 1 << ENCODER_BUTTON:
             self.emit(event.UI_SEQUENCE_SAVE)
 
         hold_millis = ticks_diff(self._now, self._last_hold_millis)
 
         # Reset pattern (btn 1 & 2 pressed for 1s)
-        if all(self.buttons[i].pressing for i in (0, 1)) and hold_millis > 1000:
+        if pressed & 0b0011 == 0b0011 and hold_millis > 1000:
             self._last_hold_millis = self._now
             self.emit(event.UI_TRIGGER_RESET_PATTERN)
 
-        # Random pattern (btn 2 & 3 pressed for 500ms)
-        if all(self.buttons[i].pressing for i in (2, 3)) and hold_millis > 500:
+        # Random pattern (btn 3 & 4 pressed for 500ms)
+        if pressed & 0b1100 == 0b1100 and hold_millis > 500:
             self._last_hold_millis = self._now
             self.emit(event.UI_PATTERN_RANDOMIZE)
 
         # Turn encoder (without buttons pressed)
-        if not any(button.pressing for button in self.buttons):
-            if self.encoder_button.fell:
+        if not pressed & 0b1111:
+            if fell & 1 << ENCODER_BUTTON:
                 self.emit(event.UI_PLAY_STOP)
 
-            if self._encoder_delta:
-                self.emit(event.UI_TEMPO_VALUE_CHANGE, self._encoder_delta)
+            if encoder_delta:
+                self.emit(event.UI_TEMPO_VALUE_CHANGE, encoder_delta)
 
     def sync_clock_in(self):
+        """Turn new clock pulses into steps, without dropping any.
+
+        If the loop stalled, more than one pulse shows up at once. Each one
+        still counts, and its time is rebuilt from the known pulse spacing, or
+        spread over the time since the last poll if the spacing is unknown.
+        Catch-up steps are emitted back to back.
+        """
+        last_poll, self._last_clock_poll = self._last_clock_poll, self._now
         count = self.clock_in.count
-        if count == self._last_clock_in_count:
+        pulses = count - self._last_clock_in_count
+        if pulses == 0:
             return
-
-        self._clock_pulses += 1
+        if pulses < 0:
+            pulses = count  # counter was reset
         self._last_clock_in_count = count
 
-        self.emit(event.UI_SYNC_CLOCK_IN, self._now)
+        if self._last_pulse_millis is not None and pulses == 1:
+            interval = ticks_diff(self._now, self._last_pulse_millis)
+            self._pulse_millis = interval if interval < 2000 else 0
+        self._last_pulse_millis = self._now
+
+        window = ticks_diff(self._now, last_poll)
+        for k in range(pulses):
+            if self._pulse_millis:
+                at = ticks_add(self._now, -(pulses - 1 - k) * self._pulse_millis)
+            else:
+                at = ticks_add(last_poll, (k + 1) * window // pulses)
+
+            # the first pulse of every group is the step, like StepSequencer.clock_tick()
+            pulse = self._clock_pulses
+            self._clock_pulses = (pulse + 1) % self._pulses_per_step
+            if pulse == 0:
+                self.emit(event.UI_SYNC_CLOCK_IN, at)
+
+
+class KeypadUI(UI):
+    """UI on top of keypad.Keys, which scans and debounces the buttons in the
+    background and queues press/release events.
+
+    A loop pass with no key event, no encoder movement and no combo held only
+    costs the queue check, the encoder position read and the clock input
+    check. Emits exactly the same UI_* events as UI.
+    """
+
+    def __init__(self, clock_ppqn=SYNC_CLOCK_IN_PPQN, tracks=len(BUTTON_PINS)):
+        super().__init__(clock_ppqn, tracks)
+        self._pressed = 0
+        self._key_event = keypad.Event()
+        self._last_encoder_position = self.encoder.position
+
+    def _setup_buttons(self):
+        self.keys = keypad.Keys(BUTTON_PINS + (ENCODER_BUTTON_PIN,), value_when_pressed=False, pull=True)
+        self.encoder_button = None
+        self.buttons = []
 
+    def update(self):
+        self._now = ticks_ms()
+        fell = rose = 0
+        key_event = self._key_event
+        while self.keys.events.get_into(key_event):
+            bit = 1 << key_event.key_number
+            if key_event.pressed:
+                self._pressed |= bit
+                fell |= bit
+            else:
+                self._pressed &= ~bit
+                rose |= bit
 
-class LED:
+        position = self.encoder.position
+        delta = self._encoder_delta = position - self._last_encoder_position
+        self._last_encoder_position = position
+
+        pressed = self._pressed
+        if fell or rose or delta or pressed & 0b0011 == 0b0011 or pressed & 0b1100 == 0b1100:
+            self._handle_buttons(pressed, fell, rose, delta)
+
+        self.sync_clock_in()
+
+
+class Framebuffer:
+    """What a display should show, pushed to the hardware by flush().
+
+    Drawing only updates memory and marks the frame dirty, so any number of
+    changes within a loop pass cost a single write, and none when the frame
+    ends up as it already was. Call flush() once per main loop pass.
+    """
+
+    def __init__(self):
+        self.dirty = False
+
+    def flush(self):
+        if self.dirty:
+            self.dirty = False
+            self._show()
+
+    def _show(self):
+        """Write the frame to the hardware, the backends do"""
+        pass
+
+
+class LED(Framebuffer):
     def __init__(self):
+        super().__init__()
         self.tempo_pin = digitalio.DigitalInOut(TEMPO_LED_PIN)
         self.tempo_pin.direction = digitalio.Direction.OUTPUT
         self.tempo_pin.value = False
@@ -163,24 +292,33 @@ class LED:
         spi = busio.SPI(LEDS_595_SCLK, MOSI=LEDS_595_DATA)
         latch_pin = digitalio.DigitalInOut(LEDS_595_LATCH_PIN)
         self.sr = adafruit_74hc595.ShiftRegister74HC595(spi, latch_pin, number_of_shift_registers=2)
+        self._gpio = bytearray(2)
+        self._value = 0  # 16 bit frame
+        self._shown = -1  # last frame written to the shift registers, unknown at first
+        self._tempo_on = False
 
         self.pattern = 0b0
+        self.page = 0  # 16 steps shown at a time for longer patterns
         self.sequence_mode = False
         self.saving_mode = False
         self.sequence_idx = 0
 
     def clear(self):
-        self.sr.gpio = bytearray((0, 0))
+        self._update_leds(0)
 
     def toggle_tempo_led(self, step):
         """turn on tempo led on even numbers"""
-        self.tempo_pin.value = step % 4 == 0
+        on = step % 4 == 0
+        if on != self._tempo_on:
+            self._tempo_on = on
+            self.tempo_pin.value = on
 
     def next_step(self, step):
         """sum up pattern and current step in an OR operation"""
         if self.sequence_mode or self.saving_mode: 
             return
-        value = self.pattern | 1 << step
+        self.page = step >> 4
+        value = self.pattern >> (self.page << 4) | 1 << (step & 0xF)
         self._update_leds(value)
 
     def update_pattern(self, pattern):
@@ -208,40 +346,61 @@ class LED:
         self.show_sequence()
 
     def show_pattern(self):
-        self.clear()
-        self._update_leds(self.pattern)
+        self._update_leds(self.pattern >> (self.page << 4))
 
     def show_sequence(self):
-        self.clear()
         self._update_leds(1 << self.sequence_idx)
     
     def _update_leds(self, value):
-        """value: 16 bit pattern byte"""
+        """value: 16 bit pattern byte, shown on the next flush()"""
+        self._value = value & 0xFFFF
+        self.dirty = self._value != self._shown
+
+    def _show(self):
+        value = self._shown = self._value
         # split 16-bit pattern into two 8-bit bytes (one for each shift register)
         # to display the bits as LSB-first
-        self.sr.gpio = bytearray((value >> 8 & 0xFF, value & 0xFF))
+        self._gpio[0] = value >> 8 & 0xFF
+        self._gpio[1] = value & 0xFF
+        self.sr.gpio = self._gpio
 
 
-class NeoPixel:
+class NeoPixel(Framebuffer):
     STEP_ON_COLOR = (255, 0, 0)
     BAR_COLOR = (255, 0, 255)
     HEAD_COLOR = (255, 255, 0)
+    OFF_COLOR = (0, 0, 0)
 
     def __init__(self, step_count=16):
-        self.pixels = neopixel.NeoPixel(board.GP2, n=step_count, brightness=0.04)
-        self.pixels.fill(0)
+        super().__init__()
+        # pixels are only sent by flush(), as one batched show()
+        self.pixels = neopixel.NeoPixel(board.GP2, n=step_count, brightness=0.04, auto_write=False)
+        self.pixels.fill(self.OFF_COLOR)
+        self._colors = [self.OFF_COLOR] * step_count  # what every pixel is set to
+        self.dirty = True  # the fill() above
         self.step_count = step_count
         self.pattern = 0b0
         self._prev_pixel = self.BAR_COLOR
 
+    def _set(self, idx, color):
+        """Set a pixel, the frame only gets dirty when it changes"""
+        if self._colors[idx] != color:
+            self._colors[idx] = color
+            self.pixels[idx] = color
+            self.dirty = True
+
     def next_step(self, step):
-        self.pixels[(step - 1) % self.step_count] = self._prev_pixel
-        self._prev_pixel = self.pixels[step]
-        self.pixels[step] = self.BAR_COLOR if step == 0 else self.HEAD_COLOR
+        step %= self.step_count
+        self._set((step - 1) % self.step_count, self._prev_pixel)
+        self._prev_pixel = self._colors[step]
+        self._set(step, self.BAR_COLOR if step == 0 else self.HEAD_COLOR)
 
     def update_pattern(self, pattern):
         """pattern: integer representing the pattern"""
         self.pattern = pattern
-        for step in range(pattern.bit_length()):
-            self.pixels[step] = self.STEP_ON_COLOR if (self.pattern & 1 << step) > 0 else 0
-        self._prev_pixel = self.pixels[0]
+        for step in range(min(pattern.bit_length(), self.step_count)):
+            self._set(step, self.STEP_ON_COLOR if (self.pattern & 1 << step) > 0 else self.OFF_COLOR)
+        self._prev_pixel = self._colors[0]
+
+    def _show(self):
+        self.pixels.show()
@@ -1,81 +1,153 @@
-import os
-import random
-import board
-import audiopwmio
-# import audiobusio
-import audiocore
-import audiomixer
+from time import monotonic_ns, sleep
 
+# only what the first beat needs is imported up front, the rest is
+# imported by the boot stage that uses it, see tools/build_mpy.py as well
 from midi import MIDI
-import interface
 import sequencer
 import event
+import tracebuf
 
 SAMPLE_PACK = "dr55"
-SAMPLE_FOLDER = os.listdir("samplepack")
 SAMPLE_RATE = 22500
-MAX_VOICES = 4
-
-dac = audiopwmio.PWMAudioOut(board.GP15)
-# dac = audiobusio.I2SOut(board.GP10, board.GP11, board.GP9)
-mixer = audiomixer.Mixer(voice_count=MAX_VOICES, sample_rate=SAMPLE_RATE, channel_count=1)
-dac.play(mixer)
-
-samples = []
+SAMPLE_RAM_BUDGET = 96 * 1024  # bytes of samples kept in RAM, the rest streams from flash
+SAMPLE_SWAP_MS = 10  # only load samples of an incoming pack when the next step is further away
+MAX_VOICES = 4  # mixer voices, shared by the tracks
+TRACKS = 8
+SONG = None  # e.g. [(0, 4), (1, 2)]: play slot 0 for 4 bars, slot 1 for 2, and over
+SWING = 0  # play odd steps this many quarter steps late, up to 2
+SYNC_CLOCK_IN_PPQN = 4  # pulses per quarter note on the sync input, a multiple of 4
+TRACE_DRAIN_MS = 20  # only write trace records when the next step is further away
+EDIT_FLUSH_MS = 2  # only apply pattern edits when the next step is further away
+LINK_POLL_MS = 10  # only serve tools/euclidlink.py when the next step is further away
+BOOT_STAGE_MS = 20  # boot stages after the first beat only start when the next step is further away
+
+boot_ms = monotonic_ns() // 1_000_000  # monotonic counts from reset
+boot_stages = []  # (stage, ms since reset)
+
+
+def boot_mark(stage):
+    ms = monotonic_ns() // 1_000_000
+    tracebuf.log(tracebuf.BOOT, len(boot_stages), ms)
+    boot_stages.append((stage, ms))
+
+
+def between_steps():
+    """Keep the clock and MIDI going until the next step is at least BOOT_STAGE_MS away"""
+    midi.poll()
+    while seq.playing and seq.idle_ms() < BOOT_STAGE_MS:
+        seq.update()
+        midi.poll()
+        sleep(0.0002)  # lets USB run on the device
+
+
+def poll_samples():
+    loading, pack = samples.loading, samples.pack
+    if samples.poll() or not loading or any(stage == "samples" for stage, _ in boot_stages):
+        return
+    if samples.active_pack != pack:
+        print(f"no samples yet, {pack} was not loaded")  # tracks stay silent until a swap succeeds
+        return
+    boot_mark("samples")
+    print(f"{samples.ram_bytes} bytes of samples in RAM, ready {boot_stages[-1][1] - boot_ms}ms after main.py")
 
 
-def load_samplepack(name, randomize=False):
-    global samples
-
-    pack = f"samplepack/{name}"
-    filenames = os.listdir(pack)
+def play_audio(triggers):
+    voices.trigger(triggers, samples.samples)
 
-    for idx in range(MAX_VOICES):
-        if randomize:
-            filename = random.choice(filenames)
-        else:
-            filename = filenames[idx]
-        print(f"loading {filename}...")
-        samples.append(audiocore.WaveFile(open(f"{pack}/{filename}", "rb")))
 
+# Stage 1, the clock: sequencer and MIDI, playing the boot snapshot
+midi = MIDI(channels=TRACKS)
+seq = sequencer.EuclideanSequencer(channels=TRACKS, tempo=90, precise=True)
+seq.register(event.SEQ_STEP_TRIGGER_MIDI, midi.trigger_notes)
+midi.register(event.MIDI_CLOCK, seq.clock_tick)
+midi.register(event.MIDI_START, seq.ext_start)
+midi.register(event.MIDI_CONTINUE, seq.ext_continue)
+midi.register(event.MIDI_STOP, seq.ext_stop)
+midi.register(event.MIDI_STOP, midi.release)
+midi.register(event.MIDI_SONG_POSITION, seq.song_position)
+
+# freeze the subscriber tables, later stages registering recompile them
+midi.compile()
+seq.compile()
+
+restored = seq.restore_snapshot()  # one small file, the store is read later
+seq.set_swing(SWING)
+seq.play()
+seq.update()  # step 0 goes out right away
+boot_mark("first beat")
 
-def play_audio(triggers):
-    for ch, trigger in enumerate(triggers):
-        if trigger:
-            sample = samples[ch]
-            mixer.voice[ch].level = 0.8
-            mixer.voice[ch].play(sample)
+# Stage 2, the sequence store
+between_steps()
+seq.load_sequences(load=not restored)
+# seq.randomize()
+if SONG:
+    seq.set_chain(SONG)
+boot_mark("sequences")
 
+# Stage 3, audio: the sample pack loads in the background, tracks stay silent until it is in
+between_steps()
+import board
+import audiopwmio
+# import audiobusio
+import audiomixer
+from samples import SampleCache
+from voices import VoicePool
 
-# Print disk info
-fs_stat = os.statvfs('/')
-print(f"Disk size: {fs_stat[0] * fs_stat[2] / 1024 / 1024} MB")
-print(f"Free space: {fs_stat[0] * fs_stat[3] / 1024 / 1024} MB")
+between_steps()
+dac = audiopwmio.PWMAudioOut(board.GP15)
+# dac = audiobusio.I2SOut(board.GP10, board.GP11, board.GP9)
+mixer = audiomixer.Mixer(voice_count=MAX_VOICES, sample_rate=SAMPLE_RATE, channel_count=1)
+dac.play(mixer)
 
-# Connect things!
-midi = MIDI()
-seq = sequencer.EuclideanSequencer(channels=MAX_VOICES, tempo=90)
-seq.register(event.SEQ_STEP_TRIGGER_MIDI, midi.trigger_notes)
+voices = VoicePool(mixer, TRACKS, level=0.8)
+samples = SampleCache(TRACKS, SAMPLE_RATE, budget=SAMPLE_RAM_BUDGET, pool=voices)
 
 try:
-    load_samplepack(SAMPLE_PACK, randomize=False)
+    print(f"loading {SAMPLE_PACK}...")
+    samples.swap(SAMPLE_PACK, randomize=False)
     seq.register(event.SEQ_STEP_TRIGGER_CHANNELS, play_audio)
 except Exception as e:
     print(e)
+boot_mark("audio")
+
+# Stage 4, disk info
+between_steps()
+import os
+
+fs_stat = os.statvfs('/')
+print(f"Disk size: {fs_stat[0] * fs_stat[2] / 1024 / 1024} MB")
+print(f"Free space: {fs_stat[0] * fs_stat[3] / 1024 / 1024} MB")
 
-ui = interface.UI()
+# Stage 5, controls
+between_steps()
+import interface
+from edits import EditQueue
+
+# background scanned keys when available, polled Debouncers otherwise
+ui_class = interface.KeypadUI if interface.keypad else interface.UI
+ui = ui_class(clock_ppqn=SYNC_CLOCK_IN_PPQN, tracks=TRACKS)
+# pattern edits are summed and applied once per display frame, pending ones first when something reads them
+edits = EditQueue(seq, TRACKS)
+for ui_event in (event.UI_PLAY_STOP, event.UI_PATTERN_RANDOMIZE, event.UI_TRIGGER_RESET_PATTERN,
+                 event.UI_SEQUENCE_SCHEDULE, event.UI_SEQUENCE_SAVE):
+    ui.register(ui_event, edits.flush)
 ui.register(event.UI_TEMPO_VALUE_CHANGE, seq.add_tempo)
-ui.register(event.UI_HITS_VALUE_CHANGE, seq.update_hits)
-ui.register(event.UI_OFFSET_VALUE_CHANGE, seq.update_offsets)
-ui.register(event.UI_STEP_LENGTH_VALUE_CHANGE, seq.update_lengths)
+ui.register(event.UI_HITS_VALUE_CHANGE, edits.hits)
+ui.register(event.UI_OFFSET_VALUE_CHANGE, edits.offsets)
+ui.register(event.UI_STEP_LENGTH_VALUE_CHANGE, edits.lengths)
 ui.register(event.UI_PLAY_STOP, seq.toggle_play_stop)
+ui.register(event.UI_PLAY_STOP, midi.release)
 ui.register(event.UI_PATTERN_RANDOMIZE, seq.randomize)
 ui.register(event.UI_SYNC_CLOCK_IN, seq.trigger_next)
 ui.register(event.UI_VOICE_CHANGE, seq.update_active_voice)
 ui.register(event.UI_TRIGGER_RESET_PATTERN, seq.reset)
 ui.register(event.UI_SEQUENCE_SCHEDULE, seq.schedule_sequence)
 ui.register(event.UI_SEQUENCE_SAVE, seq.save_sequence)
+ui.compile()
+boot_mark("controls")
 
+# Stage 6, displays
+between_steps()
 leds = interface.LED()
 ui.register(event.UI_SEQUENCE_MODE, leds.set_sequence_mode)
 seq.register(event.SEQ_SEQUENCE_SELECT, leds.select_sequence)
@@ -83,14 +155,69 @@ seq.register(event.SEQ_ACTIVE_STEP, leds.toggle_tempo_led)
 seq.register(event.SEQ_ACTIVE_STEP, leds.next_step)
 seq.register(event.SEQ_PATTERN_CHANGE, leds.update_pattern)
 seq.register(event.SEQ_SEQUENCE_SAVING, leds.set_saving_mode)
+leds.update_pattern(seq.patterns[seq.active_ch])  # the first pattern went out before the LEDs were there
 # ring = interface.NeoPixel()
 # seq.register(event.SEQ_ACTIVE_STEP, ring.next_step)
 # seq.register(event.SEQ_PATTERN_CHANGE, ring.update_pattern)
+boot_mark("displays")
 
-seq.load_sequences()
-# seq.randomize()
-seq.play()
+# Stage 7, host link on the USB data port (tools/euclidlink.py), idle when boot.py didn't enable it
+between_steps()
+from cdc import DataLink
+
+link = DataLink(seq, samples, midi)
+boot_mark("link")
 
+# Stage 8, main loop: collect garbage right after steps, and watch for allocations in steady playback
+between_steps()
+from memory import MemoryManager
+
+try:
+    import runtime  # needs asyncio and adafruit_ticks from the bundle in lib/
+except ImportError:
+    runtime = None
+
+memory = MemoryManager(seq)
+seq.register(event.SEQ_ACTIVE_STEP, memory.step)
+seq.register(event.SEQ_SEQUENCE_SELECT, memory.unsteady)
+midi.register(event.MIDI_START, memory.unsteady)
+for ui_event in (event.UI_PLAY_STOP, event.UI_HITS_VALUE_CHANGE, event.UI_OFFSET_VALUE_CHANGE,
+                 event.UI_STEP_LENGTH_VALUE_CHANGE, event.UI_VOICE_CHANGE, event.UI_TEMPO_VALUE_CHANGE,
+                 event.UI_PATTERN_RANDOMIZE, event.UI_TRIGGER_RESET_PATTERN, event.UI_SEQUENCE_SAVE):
+    ui.register(ui_event, memory.unsteady)
+link.register(event.CDC_COMMAND, memory.unsteady)
+link.compile()
+boot_mark("ready")
+
+print(f"main.py started {boot_ms}ms after reset, "
+      + ", ".join(f"{stage} +{ms - boot_ms}ms" for stage, ms in boot_stages)
+      + ("" if restored else " (no boot snapshot)"))
+
+if runtime is not None:
+    # edits flush like a display, once per frame and before the LEDs show them, add ring to use it
+    rt = runtime.Runtime(seq, ui, midi, displays=(edits, leds), memory=memory)
+    rt.add_idle(poll_samples, SAMPLE_SWAP_MS)
+    rt.add_idle(tracebuf.drain, TRACE_DRAIN_MS)
+    rt.add_idle(link.poll, LINK_POLL_MS)
+    rt.run()
+
+# plain loop when asyncio is not installed
 while True:
     seq.update()
+    midi.poll()
     ui.update()
+    if seq.idle_ms() > EDIT_FLUSH_MS:
+        edits.poll()
+    leds.flush()
+    # ring.flush()
+    memory.poll()
+
+    if (samples.loading or samples.retiring) and seq.idle_ms() > SAMPLE_SWAP_MS:
+        poll_samples()
+
+    if tracebuf.buffer.pending() and seq.idle_ms() > TRACE_DRAIN_MS:
+        tracebuf.drain()
+
+    if seq.idle_ms() > LINK_POLL_MS:
+        link.poll()
+    memory.resync()
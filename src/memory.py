@@ -0,0 +1,111 @@
+import gc
+from time import monotonic_ns
+
+import tracebuf
+
+COLLECT_IDLE_MS = 8  # only collect when the next step is at least this far away
+STOPPED_COLLECT_MS = 100  # while stopped, collect at most this often
+AUTO_COLLECT_SHARE = 2  # automatic collection after 1/2 of the free heap got allocated
+WARMUP_STEPS = 32  # steps after start or an edit before playback counts as steady
+
+
+class MemoryManager:
+    """Runs the garbage collector right after a step, and watches allocations.
+
+    poll() collects in the idle window after a step fired, and only if
+    something was allocated since the last collection; while stopped it
+    collects every STOPPED_COLLECT_MS when something was. Automatic
+    collection stays on as the safety net, with its threshold raised to
+    1/AUTO_COLLECT_SHARE of the free heap so the collections after the
+    steps come first: with it off, a full heap raises MemoryError instead
+    of collecting.
+
+    poll() also reads gc.mem_alloc() every loop pass. Once playback has
+    been steady for WARMUP_STEPS, any pass that allocated is counted and
+    logged as a tracebuf.ALLOC record with the step it happened at. Use it
+    with event.INSTRUMENT to see which handler allocates. Idle work that is
+    allowed to allocate goes between poll() and resync().
+    """
+
+    def __init__(self, seq, idle_ms=COLLECT_IDLE_MS, warmup_steps=WARMUP_STEPS):
+        self.seq = seq
+        self.idle_ms = idle_ms
+        self.warmup_steps = warmup_steps
+
+        self.collections = 0
+        self.collect_us_max = 0
+        self.mem_free_min = gc.mem_free()
+        self.steady_allocs = 0  # loop passes that allocated during steady playback
+        self.steady_bytes = 0
+        self.loop_bytes_max = 0
+
+        self._stepped = False
+        self._steady_in = warmup_steps
+        self._allocated = gc.mem_alloc()
+        self._collected_at = self._allocated
+        self._collected_ns = monotonic_ns()
+        if hasattr(gc, "threshold"):  # not on the host
+            gc.threshold(gc.mem_free() // AUTO_COLLECT_SHARE)
+
+    def step(self, *args):
+        """SEQ_ACTIVE_STEP subscriber"""
+        self._stepped = True
+        if self._steady_in:
+            self._steady_in -= 1
+
+    def unsteady(self, *args):
+        """Subscriber for whatever is expected to allocate (edits, loads, transport)"""
+        self._steady_in = self.warmup_steps
+
+    @property
+    def steady(self):
+        return self.seq.playing and not self._steady_in
+
+    def poll(self):
+        """Call once per loop pass, after the sequencer update"""
+        allocated = gc.mem_alloc()
+        delta = allocated - self._allocated
+        self._allocated = allocated
+        if delta > 0:
+            if delta > self.loop_bytes_max:
+                self.loop_bytes_max = delta
+            if self.steady:
+                self.steady_allocs += 1
+                self.steady_bytes += delta
+                tracebuf.log(tracebuf.ALLOC, self.seq.i, delta, tracebuf.WARN)
+
+        if not self.seq.playing:
+            # no steps to wait for, e.g. edits or link traffic while stopped
+            if allocated != self._collected_at:
+                if monotonic_ns() - self._collected_ns > STOPPED_COLLECT_MS * 1_000_000:
+                    self.collect()
+        elif self._stepped and self.seq.idle_ms() >= self.idle_ms:
+            self._stepped = False
+            if allocated != self._collected_at:
+                self.collect()
+
+    def resync(self):
+        """Leave out what was allocated since poll(), for idle work that
+        allocates by design like trace output or sample loading"""
+        self._allocated = gc.mem_alloc()
+
+    def collect(self):
+        start = monotonic_ns()
+        gc.collect()
+        took_us = (monotonic_ns() - start) // 1000
+        free = gc.mem_free()
+
+        self.collections += 1
+        if took_us > self.collect_us_max:
+            self.collect_us_max = took_us
+        if free < self.mem_free_min:
+            self.mem_free_min = free
+        self._allocated = self._collected_at = gc.mem_alloc()
+        self._collected_ns = monotonic_ns()
+        tracebuf.log(tracebuf.GC, min(took_us, 0xFFFF), free)
+
+    def report(self):
+        print(f"gc: {self.collections} collections, slowest {self.collect_us_max}us, "
+              f"lowest free {self.mem_free_min}B")
+        print(f"allocations: {self.loop_bytes_max}B max per loop, "
+              f"{self.steady_allocs} loops allocated {self.steady_bytes}B while steady")
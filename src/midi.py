@@ -1,21 +1,168 @@
 import usb_midi
+from adafruit_ticks import ticks_ms
+
 import event
 
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+SONG_POSITION = 0xF2
+CLOCK = 0xF8
+START = 0xFA
+CONTINUE = 0xFB
+STOP = 0xFC
+
+# data bytes following a status, by high nibble (channel) or full byte (system)
+_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2, 0xF1: 1, 0xF2: 2, 0xF3: 1}
+
 
 class MIDI(event.EventEmitter):
-    def __init__(self):
+    def __init__(self, channels=16, gate_steps=2, running_status=True):
         super().__init__()
         self.midi_in, self.midi_out = usb_midi.ports
+        self.channels = channels
+        self.running_status = running_status
+        self.gate_steps = bytearray(gate_steps for _ in range(channels))  # note length per voice, in steps
+
+        # scheduled note offs: steps left per voice (0 = silent) and its note
+        self._gates = bytearray(channels)
+        self._gate_notes = bytearray(channels)
+        self._velocities = bytearray(channels)  # note ons collected for the current step
+        self._pending_notes = bytearray(channels)
+
+        # one step worth of messages (an off and an on per voice), sent in a single write
+        self._buf = bytearray(6 * channels)
+        mv = memoryview(self._buf)
+        self._views = tuple(mv[:n] for n in range(len(self._buf) + 1))
+        self._len = 0
+        self._status = 0
+
+        # input parser state
+        self._in_buf = bytearray(64)
+        self._in_status = 0
+        self._in_needed = 0  # data bytes still expected for _in_status
+        self._in_data = 0  # first data byte
+
+    def _add(self, status, note, velocity):
+        buf = self._buf
+        n = self._len
+        if status != self._status or not self.running_status:
+            buf[n] = status
+            n += 1
+            self._status = status
+        buf[n] = note
+        buf[n + 1] = velocity
+        self._len = n + 2
+
+    def _flush(self):
+        if self._len:
+            self.midi_out.write(self._views[self._len])
+        self._len = 0
+        self._status = 0
+
+    def poll(self):
+        """Read whatever arrived on midi_in and handle clock and transport.
+
+        Call it from the main loop, it never blocks nor allocates. Emits
+        MIDI_CLOCK, MIDI_START/CONTINUE/STOP and MIDI_SONG_POSITION.
+        """
+        n = self.midi_in.readinto(self._in_buf)
+        if not n:
+            return
+        now = ticks_ms()
+        buf = self._in_buf
+        for idx in range(n):
+            self._parse(buf[idx], now)
+
+    def _parse(self, byte, now):
+        if byte >= 0xF8:
+            # real time messages can show up anywhere, even between data bytes
+            if byte == CLOCK:
+                self.emit(event.MIDI_CLOCK, now)
+            elif byte == START:
+                self.emit(event.MIDI_START)
+            elif byte == CONTINUE:
+                self.emit(event.MIDI_CONTINUE)
+            elif byte == STOP:
+                self.emit(event.MIDI_STOP)
+            return
+
+        if byte & 0x80:
+            self._in_status = byte
+            self._in_needed = _DATA_LENGTHS.get(byte if byte >= 0xF0 else byte & 0xF0, 0)
+            self._in_data = -1
+            return
+
+        if not self._in_needed:
+            return  # sysex payload or stray data
+
+        if self._in_data < 0 and self._in_needed == 2:
+            self._in_data = byte
+            return
+
+        if self._in_status == SONG_POSITION:
+            self.emit(event.MIDI_SONG_POSITION, self._in_data | byte << 7)
+            self._in_needed = 0  # no running status for system common
+        self._in_data = -1  # channel messages keep running status
+
+    def set_gate(self, ch, steps):
+        """note length of voice ch in steps, at least one"""
+        self.gate_steps[ch] = max(1, min(steps, 255))
 
     def note_on(self, ch, note, velocity):
-        self.midi_out.write(bytes([0x90 | (ch & 0xF), note, velocity]))
+        self._add(NOTE_ON | (ch & 0xF), note, velocity)
+        self._flush()
 
     def note_off(self, ch, note, velocity):
-        self.midi_out.write(bytes([0x80 | (ch & 0xF), note, velocity]))
+        self._add(NOTE_OFF | (ch & 0xF), note, velocity)
+        self._flush()
+
+    def trigger_notes(self, notes, substep=False):
+        """Send a step worth of (ch, note, velocity) in one write.
+
+        Called once per step: sounding notes count their gate down and get
+        their note off when it runs out. Calls for sub-steps in between
+        (substep True) only play their notes, gates keep counting steps.
+        Note offs go out as note on with velocity 0 so each voice's off and
+        on share the running status.
+        """
+        velocities = self._velocities
+        pending = self._pending_notes
+        gates = self._gates
+        gate_notes = self._gate_notes
 
-    def trigger_notes(self, notes):
         for ch, note, velocity in notes:
             if velocity > 0:
-                self.note_on(ch, note, velocity)
-            else:
-                self.note_off(ch, note, velocity)
\ No newline at end of file
+                velocities[ch] = velocity
+                pending[ch] = note
+            elif gates[ch]:
+                gates[ch] = 1  # explicit note off, released below
+                if substep:
+                    self._add(NOTE_ON | (ch & 0xF), gate_notes[ch], 0)
+                    gates[ch] = 0
+
+        for ch in range(self.channels):
+            velocity = velocities[ch]
+            gate = gates[ch]
+            if gate:
+                if not substep:
+                    gate -= 1
+                # release when the gate runs out or the voice is hit again
+                if gate == 0 or velocity:
+                    self._add(NOTE_ON | (ch & 0xF), gate_notes[ch], 0)
+                    gate = 0
+            if velocity:
+                self._add(NOTE_ON | (ch & 0xF), pending[ch], velocity)
+                gate_notes[ch] = pending[ch]
+                gate = self.gate_steps[ch]
+                velocities[ch] = 0
+            gates[ch] = gate
+
+        self._flush()
+
+    def release(self, *args):
+        """note off for every sounding voice, e.g. when the sequencer stops"""
+        for ch in range(self.channels):
+            if self._gates[ch]:
+                self._add(NOTE_ON | (ch & 0xF), self._gate_notes[ch], 0)
+                self._gates[ch] = 0
+        self._flush()
@@ -0,0 +1,94 @@
+import asyncio
+
+STEP_GUARD_MS = 2  # input, display and idle work stay out of the way this close to a step
+CLOCK_MAX_SLEEP_MS = 10  # tempo or transport changes are picked up at least this often
+INPUT_MS = 1
+MIDI_MS = 1
+DISPLAY_MS = 16
+
+
+class Runtime:
+    """Main loop as asyncio tasks: sequencer clock, input, MIDI, display and idle work.
+
+    The clock task sleeps until just before the next step and polls the
+    sequencer until it fires. Input scanning, display refresh and idle work
+    are skipped while a step is less than `guard_ms` away, so they can't
+    make it late. MIDI input is polled every MIDI_MS no matter what, it
+    carries the external clock.
+    """
+
+    def __init__(self, seq, ui=None, midi=None, displays=(), memory=None, guard_ms=STEP_GUARD_MS):
+        self.seq = seq
+        self.ui = ui
+        self.midi = midi
+        self.displays = displays
+        self.memory = memory
+        self.guard_ms = guard_ms
+        self._idle = []
+
+    def add_idle(self, callback, idle_ms):
+        """Call callback() whenever the next step is more than idle_ms away"""
+        self._idle.append((callback, max(idle_ms, self.guard_ms)))
+
+    def clear(self):
+        """No step is due within guard_ms"""
+        return self.seq.idle_ms() > self.guard_ms
+
+    async def clock(self):
+        seq = self.seq
+        while True:
+            seq.update()
+            idle = seq.idle_ms()
+            # wake a millisecond early, sleeps are only ms accurate
+            await asyncio.sleep_ms(min(idle - 1, CLOCK_MAX_SLEEP_MS) if idle > 1 else 0)
+
+    async def input(self):
+        ui = self.ui
+        while True:
+            if self.clear():
+                ui.update()
+            await asyncio.sleep_ms(INPUT_MS)
+
+    async def midi_io(self):
+        midi = self.midi
+        while True:
+            midi.poll()
+            await asyncio.sleep_ms(MIDI_MS)
+
+    async def display(self):
+        displays = self.displays
+        while True:
+            if self.clear():
+                for display in displays:
+                    display.flush()
+            await asyncio.sleep_ms(DISPLAY_MS)
+
+    async def idle(self):
+        seq = self.seq
+        work = self._idle
+        memory = self.memory
+        while True:
+            if memory is not None:
+                memory.poll()
+            for callback, idle_ms in work:
+                if seq.idle_ms() > idle_ms:
+                    callback()
+            if memory is not None:
+                memory.resync()
+            await asyncio.sleep_ms(self.guard_ms)
+
+    async def main(self):
+        # the clock goes first, tasks that are due together run in creation order
+        tasks = [asyncio.create_task(self.clock())]
+        if self.midi is not None:
+            tasks.append(asyncio.create_task(self.midi_io()))
+        if self.ui is not None:
+            tasks.append(asyncio.create_task(self.input()))
+        if self.displays:
+            tasks.append(asyncio.create_task(self.display()))
+        if self._idle or self.memory is not None:
+            tasks.append(asyncio.create_task(self.idle()))
+        await asyncio.gather(*tasks)
+
+    def run(self):
+        asyncio.run(self.main())
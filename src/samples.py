@@ -0,0 +1,251 @@
+import os
+import gc
+import json
+import struct
+import random
+from array import array
+
+import audiocore
+
+SAMPLE_FOLDER = "samplepack"
+MANIFEST = "manifest.json"  # written by tools/packer.py
+RAM_RESERVE = 16 * 1024  # keep this much heap free whatever the budget says
+
+
+def read_wave_header(f):
+    """(data offset, data bytes, sample rate, channels, bits) of an open WAV file"""
+    riff = f.read(12)
+    if riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise ValueError("not a WAV file")
+
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise ValueError("WAV file without data")
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", f.read(16))
+            f.seek(size - 16 + (size & 1), 1)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data before fmt")
+            _, channels, rate, _, _, bits = fmt
+            return f.tell(), size, rate, channels, bits
+        else:
+            f.seek(size + (size & 1), 1)
+
+
+class SampleCache:
+    """Samples of the active pack, one per voice, kept in RAM when they fit.
+
+    Samples are loaded into RawSample buffers while the total stays under
+    `budget` bytes, one buffer per file however many voices play it, and
+    streamed from flash as WaveFile otherwise. swap()
+    starts loading another pack in the background. Each poll() reads one
+    `chunk` at most, and the new pack replaces `samples` in one go once it
+    is complete, so playback never stops. The files the outgoing pack
+    streams from stay open until `pool`, the VoicePool playing `samples`,
+    no longer plays them, poll() closes them after that.
+
+    Packs come from tools/packer.py, already in the mixer's format: a pack
+    without a manifest.json, or packed for another rate, channel count or
+    bit depth, is refused rather than converted on every hit.
+    """
+
+    def __init__(self, voices, sample_rate, budget=96 * 1024, chunk=2048, folder=SAMPLE_FOLDER,
+                 channels=1, bits=16, pool=None):
+        self.voices = voices
+        self.pool = pool
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = bits
+        self.budget = budget
+        self.chunk = chunk
+        self.folder = folder
+        self.samples = [None] * voices  # what play_audio reads, replaced on swap
+        self.pack = None  # the pack swapped to, loading or done
+        self.active_pack = None  # the pack in `samples`, playing until the swap is done
+        self.ram_bytes = 0
+        self._listings = {}
+        self._queue = None  # (path, voices) still to load for the incoming pack
+        self._incoming = None
+        self._incoming_streams = []
+        self._incoming_bytes = 0
+        self._job = None  # (voices, file, buffer, view, items read, rate, channels)
+        self._streams = []  # (WaveFile, file) of the active pack
+        self._retired = []  # (WaveFile, file) of packs swapped out, open while still playing
+
+    @property
+    def loading(self):
+        return self._queue is not None
+
+    @property
+    def retiring(self):
+        return bool(self._retired)
+
+    def packs(self):
+        return sorted(os.listdir(self.folder))
+
+    def manifest(self, name):
+        """manifest.json of a pack, checked against the mixer format"""
+        try:
+            with open(f"{self.folder}/{name}/{MANIFEST}") as f:
+                manifest = json.load(f)
+        except OSError:
+            raise ValueError(f"{name}: no {MANIFEST}, condition it with tools/packer.py")
+        packed = (manifest.get("rate"), manifest.get("channels"), manifest.get("bits"))
+        if packed != (self.sample_rate, self.channels, self.bits):
+            raise ValueError(f"{name}: packed for {packed[0]} Hz, {packed[1]} channel(s), {packed[2]}-bit, "
+                             f"the mixer plays {self.sample_rate} Hz, {self.channels}, {self.bits}-bit")
+        return manifest
+
+    def filenames(self, name):
+        """WAV files of a pack in manifest order, read once"""
+        filenames = self._listings.get(name)
+        if filenames is None:
+            filenames = [sample["file"] for sample in self.manifest(name)["samples"]]
+            self._listings[name] = filenames
+        return filenames
+
+    def forget(self, name):
+        """Read the listing of a pack again next time, its files changed"""
+        self._listings.pop(name, None)
+
+    def load(self, name, randomize=False):
+        """Load a pack right away, for boot"""
+        self.swap(name, randomize)
+        while self.poll():
+            pass
+
+    def swap(self, name, randomize=False):
+        """Start loading a pack in the background, see poll()"""
+        filenames = self.filenames(name)
+        if not filenames:
+            raise ValueError(f"{name}: empty sample pack")
+        # drop a swap still in progress
+        if self._job is not None:
+            self._job[1].close()
+            self._job = None
+        for _, f in self._incoming_streams:
+            f.close()
+
+        # every file once, with the voices that play it
+        picks = []
+        for idx in range(self.voices):
+            filename = random.choice(filenames) if randomize else filenames[idx % len(filenames)]
+            path = f"{self.folder}/{name}/{filename}"
+            for pick in picks:
+                if pick[0] == path:
+                    pick[1].append(idx)
+                    break
+            else:
+                picks.append((path, [idx]))
+
+        self.pack = name
+        self._queue = picks
+        self._incoming = [None] * self.voices
+        self._incoming_streams = []
+        # the outgoing pack is still playing, only count what it keeps in RAM
+        self._incoming_bytes = 0
+
+    def poll(self):
+        """Do one bounded piece of the swap, True while it is still going.
+
+        A pack that can't be read is dropped, the active one keeps playing.
+        """
+        if self._retired:
+            self._release()
+        if self._queue is None:
+            return False
+
+        try:
+            if self._job is None:
+                self._start_next()
+            else:
+                self._read_chunk()
+        except (OSError, ValueError, MemoryError) as e:
+            print(f"sample pack {self.pack} not loaded: {e}")
+            self._abort()
+            return False
+
+        if self._job is None and not self._queue:
+            self._finish()
+            return False
+        return True
+
+    def _start_next(self):
+        path, voices = self._queue.pop(0)
+        f = open(path, "rb")
+        offset, size, rate, channels, bits = read_wave_header(f)
+        if (rate, channels, bits) != (self.sample_rate, self.channels, self.bits):
+            f.close()
+            raise ValueError(f"{path}: {rate} Hz, {channels} channel(s), {bits}-bit, not what {MANIFEST} says")
+
+        free = gc.mem_free() if hasattr(gc, "mem_free") else size + RAM_RESERVE
+        fits = self.ram_bytes + self._incoming_bytes + size <= self.budget and size + RAM_RESERVE <= free
+        if not fits:
+            # over budget, stream it from flash, a file per voice as each reads at its own position
+            f.seek(0)
+            for idx, voice in enumerate(voices):
+                if idx:
+                    f = open(path, "rb")
+                sample = audiocore.WaveFile(f)
+                self._incoming[voice] = sample
+                self._incoming_streams.append((sample, f))
+            return
+
+        f.seek(offset)
+        items = size * 8 // bits
+        buffer = array("h" if bits == 16 else "B", [0]) * items
+        self._incoming_bytes += size
+        self._job = (voices, f, buffer, memoryview(buffer), 0, rate, channels)
+
+    def _read_chunk(self):
+        voices, f, buffer, view, done, rate, channels = self._job
+        end = min(done + self.chunk, len(buffer))
+        n = f.readinto(view[done:end])
+        done = end if n else len(buffer)  # short file, keep the silence
+        if done < len(buffer):
+            self._job = (voices, f, buffer, view, done, rate, channels)
+            return
+
+        f.close()
+        # one buffer, shared by the voices playing the same file
+        sample = audiocore.RawSample(buffer, channel_count=channels, sample_rate=rate)
+        for voice in voices:
+            self._incoming[voice] = sample
+        self._job = None
+
+    def _abort(self):
+        if self._job is not None:
+            self._job[1].close()
+            self._job = None
+        for _, f in self._incoming_streams:
+            f.close()
+        self._incoming_streams = []
+        self._queue = self._incoming = None
+        self.pack = self.active_pack
+
+    def _finish(self):
+        self._retired.extend(self._streams)
+        self.samples = self._incoming
+        self.active_pack = self.pack
+        self._streams = self._incoming_streams
+        self._incoming_streams = []
+        self.ram_bytes = self._incoming_bytes
+        self._queue = self._incoming = None
+        # RAM samples of the old pack go with the last voice playing them, files wait for _release()
+        self._release()
+        gc.collect()
+
+    def _release(self):
+        """Close the files of swapped out samples no voice plays anymore"""
+        pool = self.pool
+        keep = []
+        for sample, f in self._retired:
+            if pool is not None and pool.playing(sample):
+                keep.append((sample, f))
+            else:
+                f.close()
+        self._retired = keep
@@ -2,37 +2,143 @@
 # 3 Oct 2022 - @redraw
 # Based on picostepseq : https://github.com/todbot/picostepseq/
 from random import randint
-import os
-import json
+from time import monotonic_ns
 
-from adafruit_ticks import ticks_ms, ticks_diff
+from adafruit_ticks import ticks_ms, ticks_diff, ticks_add
 
 import event
+import store
+import tracebuf
+from wheel import TimingWheel
 
-SEQUENCES_FILE = "sequences.json"
 MAX_SEQUENCES = 16
+MIDI_TICKS_PER_STEP = 6  # 24 PPQN clock, 16th note steps
+MAX_STEPS = 64
+EUCLIDEAN_CACHE_SIZE = 256
+SUBSTEPS = 4  # sub-step resolution of swing, nudge and ratchets, per step
+WHEEL_SLOTS = 16  # sub-steps ahead events can be posted
+MASK_CACHE_SIZE = MAX_STEPS * SUBSTEPS  # more masks than a bar can play, and all of 8 voices
+
+_euclidean_cache = {}
+
+
+def euclidean(hits, steps, rotation=0):
+    """Bjorklund euclidean rhythm as an integer, bit 1 is hit, LSB is step 0.
+
+    Results are memoized, so only the first request of a given
+    (hits, steps, rotation) pays for the generator.
+    """
+    key = hits | steps << 8 | rotation << 16
+    pattern = _euclidean_cache.get(key)
+    if pattern is not None:
+        return pattern
+
+    pattern = 0
+    if hits >= steps:
+        pattern = (1 << steps) - 1
+    elif hits > 0:
+        # repeatedly pair remainders with the leading groups until at most one is left
+        groups = [[1] for _ in range(hits)]
+        remainders = [[0] for _ in range(steps - hits)]
+        while len(remainders) > 1:
+            n = min(len(groups), len(remainders))
+            paired = [groups[i] + remainders[i] for i in range(n)]
+            remainders = groups[n:] if len(groups) > n else remainders[n:]
+            groups = paired
+        step = 0
+        for group in groups + remainders:
+            for bit in group:
+                pattern |= bit << step
+                step += 1
+
+    if rotation:
+        rotation %= steps
+        pattern = (pattern >> rotation) | (pattern << steps - rotation) & ((1 << steps) - 1)
+
+    if len(_euclidean_cache) >= EUCLIDEAN_CACHE_SIZE:
+        _euclidean_cache.clear()
+    _euclidean_cache[key] = pattern
+    return pattern
+
+
+class ClockEstimator:
+    """Smooths the period of an external clock with a delay-locked loop.
+
+    Second order loop (F. Adriaensen, "Using a DLL to filter time") kept
+    relative to the last raw pulse, so float precision does not depend on
+    uptime. bandwidth is per pulse, lower is smoother but slower to follow.
+    """
+
+    def __init__(self, bandwidth=0.1):
+        self.b = 1.4142 * bandwidth
+        self.c = bandwidth * bandwidth
+        self.reset()
+
+    def reset(self):
+        self.period = 0.0  # smoothed ms between pulses, 0 until two pulses arrived
+        self._last = None
+        self._next = 0.0  # predicted next pulse, relative to the last one
+
+    def pulse(self, now):
+        """Feed a pulse at ticks_ms() time now, returns the smoothed period"""
+        last, self._last = self._last, now
+        if last is None:
+            return self.period
+
+        dt = ticks_diff(now, last)
+        if self.period == 0 or dt > 4 * self.period:
+            # first interval or the clock paused, start over from this one
+            self.period = self._next = float(dt)
+            return self.period
+
+        err = dt - self._next
+        self._next = self.period + (self.b - 1) * err
+        self.period += self.c * err
+        return self.period
 
 
 class StepSequencer(event.EventEmitter):
-    def __init__(self, step_count=16, tempo=120, playing=False, channels=6, seqno=0):
+    def __init__(self, step_count=16, tempo=120, playing=False, channels=6, seqno=0, precise=False):
         super().__init__()
         self.ext_trigger = False  # midi clocked or not
-        self.ext_trigger_millis = 0
+        self.ext_clock = ClockEstimator()
+        self._ext_ticks = 0  # MIDI clock ticks into the current step
         self.steps_per_beat = 4  # 16th note
         self.channels = channels  # aka. voices
         self.step_count = step_count
-        self.i = 0  # where in the sequence we currently are
+        self.i = step_count - 1  # where in the sequence we currently are, the first step moves on to 0
+        self.precise = precise  # absolute ns deadlines instead of whole-ms beats
+        self.lateness_us = 0  # how late the last step fired
+        self._next_step_ns = 0
+        self._next_step_ms = ticks_ms()  # same deadline in ticks, a little early
+        self._step_acc = 0
         self.set_tempo(tempo)
         self.last_beat_millis = ticks_ms()  # 'tempo' in our native tongue
         self.playing = playing  # is sequence running or not (but use .play()/.pause())
 
+        # events between steps, fired by update() on ticks_ms() times anchored to the step
+        self.wheel = TimingWheel(WHEEL_SLOTS)
+        self._sub = 0  # sub-steps of the current step already fired
+        self._sub_due = [0] * SUBSTEPS  # ticks_ms() each sub-step of the current step is due
+
     @property
     def tempo(self):
+        if self.precise and not self.ext_trigger:
+            return self._tempo
         return 60_000 // self.beat_millis // self.steps_per_beat
 
     def set_tempo(self, tempo):
-        """Sets the internal tempo. beat_millis is 1/16th note time in milliseconds"""
-        self.beat_millis = 60_000 // self.steps_per_beat // tempo
+        """Sets the internal tempo. beat_millis is 1/16th note time in milliseconds.
+
+        The exact step time is also kept as a fraction of nanoseconds,
+        _step_ns + _step_rem / _step_den, used by the precise clock.
+        """
+        self._tempo = tempo
+        self.beat_millis = int(60_000 // self.steps_per_beat // tempo)
+        self._step_den = self.steps_per_beat * round(tempo * 1000)  # milli-BPM, fractional tempos are exact
+        self._step_ns, self._step_rem = divmod(60_000_000_000_000, self._step_den)
+        self._step_acc = 0
+        tracebuf.log(tracebuf.TEMPO, int(tempo), self._step_ns // 1000)
         self.emit(event.SEQ_TEMPO_CHANGE, tempo)
 
     def add_tempo(self, delta):
@@ -40,25 +146,70 @@ class StepSequencer(event.EventEmitter):
 
     def trigger_next(self, now):
         """Trigger externally next step in sequence (should be a beat, 1/16th note)"""
+        self._ext_pulse(now, 1)
+        self.trigger(now, self.beat_millis)
+
+    def clock_tick(self, now):
+        """External 24 PPQN clock tick (MIDI clock), every 6th one is a step"""
+        self._ext_pulse(now, MIDI_TICKS_PER_STEP)
+        tick = self._ext_ticks
+        self._ext_ticks = (tick + 1) % MIDI_TICKS_PER_STEP
+        if tick == 0:
+            self.trigger(now, self.beat_millis)
+
+    def _ext_pulse(self, now, pulses_per_step):
         if not self.ext_trigger:
-            print("MIDI sync is now ON.")
+            tracebuf.log(tracebuf.SYNC, 1)
+            self.ext_clock.reset()
 
         self.ext_trigger = True
-        self.ext_trigger_millis += ticks_diff(now, self.last_beat_millis)
+        self.lateness_us = 0
 
-        self.trigger(now, self.beat_millis)
+        # step time follows the smoothed clock instead of jumping on every pulse
+        period = self.ext_clock.pulse(now)
+        if period:
+            self.beat_millis = max(1, int(period * pulses_per_step + 0.5))
 
-        # avg tempo per beat
-        if self.i % self.steps_per_beat == 0:
-            self.beat_millis = self.ext_trigger_millis // self.steps_per_beat
-            self.ext_trigger_millis = 0
+        if self.precise:
+            # pulses drive the steps, keep the deadline for the fall back check
+            now_ns = monotonic_ns()
+            self._set_deadline(now_ns + self.beat_millis * 1_000_000, now_ns)
+
+    def ext_start(self, *args):
+        """MIDI Start, play from the top on the next clock tick"""
+        self.ext_trigger = True
+        self.i = self.step_count - 1
+        self._ext_ticks = 0
+        self.wheel.clear()
+        self.playing = True
+
+    def ext_continue(self, *args):
+        """MIDI Continue, play on from the current position"""
+        self.ext_trigger = True
+        self.playing = True
+
+    def ext_stop(self, *args):
+        """MIDI Stop, keeps the position for Continue"""
+        self.pause()
+
+    def song_position(self, position):
+        """MIDI Song Position Pointer, position counts 16th notes (our steps)"""
+        self.i = (position - 1) % self.step_count
+        self._ext_ticks = 0
 
     def trigger(self, now, delta_t):
         if not self.playing:
             return
 
+        # whatever is left of the previous step goes first, late rather than lost
+        if self.wheel.pending:
+            self._finish_substeps()
+            self.wheel.advance()
+        self._schedule_substeps(now)
+
         # go to next step in sequence, get new note
         self.i = (self.i + 1) % self.step_count
+        tracebuf.log(tracebuf.STEP, self.i, self.lateness_us)
         self.trigger_step()
 
         # calculate next note timing and held note timing
@@ -68,150 +219,336 @@ class StepSequencer(event.EventEmitter):
     def trigger_step(self):
         return NotImplemented
 
+    def trigger_substep(self, mask):
+        """Play the channels set in mask, between steps"""
+        return NotImplemented
+
+    def _schedule_substeps(self, now):
+        """Sub-step times of the step firing at ticks_ms() now, counted from when it was due"""
+        start = ticks_add(now, -(self.lateness_us // 1000))
+        step_us = self._step_ns // 1000 if self.precise and not self.ext_trigger else self.beat_millis * 1000
+        due = self._sub_due
+        for sub in range(1, SUBSTEPS):
+            due[sub] = ticks_add(start, sub * step_us // SUBSTEPS // 1000)
+        self._sub = 0
+
+    def _update_substeps(self):
+        now = ticks_ms()
+        while self._sub < SUBSTEPS - 1 and ticks_diff(now, self._sub_due[self._sub + 1]) >= 0:
+            self._fire_substep()
+
+    def _finish_substeps(self):
+        while self._sub < SUBSTEPS - 1:
+            self._fire_substep()
+
+    def _fire_substep(self):
+        self._sub += 1
+        self.wheel.advance()
+        mask = self.wheel.take()
+        if mask:
+            self.trigger_substep(mask)
+
     def update(self):
         """Update state of sequencer. Must be called regularly in main"""
+        if self.wheel.pending and self.playing:
+            self._update_substeps()
+        if self.precise:
+            return self._update_precise()
+
         now = ticks_ms()
         delta_t = ticks_diff(now, self.last_beat_millis)
 
         # if time for new note, trigger it
         if delta_t >= self.beat_millis:
             if not self.ext_trigger:
+                self.lateness_us = (delta_t - self.beat_millis) * 1000
                 self.trigger(now, delta_t)
             else:
                 # fall back to internal triggering if not externally clocked for a while
                 if delta_t > self.beat_millis * 8:
                     self.ext_trigger = False
-                    print("Turning EXT TRIGGER off")
+                    tracebuf.log(tracebuf.SYNC, 0)
+
+    def _set_deadline(self, deadline_ns, now_ns):
+        self._next_step_ns = deadline_ns
+        # rounded down and a ms early, so the ns clock is read in time
+        self._next_step_ms = ticks_add(ticks_ms(), (deadline_ns - now_ns) // 1_000_000 - 1)
+
+    def _update_precise(self):
+        """Fire steps on absolute ns deadlines, the fractional part of a step
+        is carried over in _step_acc so there is no drift over long runs"""
+        if not self.playing and not self.ext_trigger:
+            return  # nothing is due, don't read the ns clock
+        if ticks_diff(self._next_step_ms, ticks_ms()) > 0:
+            return  # not close yet, monotonic_ns() returns a heap allocated int on the device
+        now_ns = monotonic_ns()
+        late_ns = now_ns - self._next_step_ns
+        if late_ns < 0:
+            return
+
+        if self.ext_trigger:
+            # fall back to internal triggering if not externally clocked for a while
+            if late_ns > self.beat_millis * 8_000_000:
+                self.ext_trigger = False
+                self._set_deadline(now_ns, now_ns)
+                tracebuf.log(tracebuf.SYNC, 0)
+            return
+
+        if not self.playing:
+            return
+
+        deadline_ns = self._next_step_ns + self._step_ns
+        self._step_acc += self._step_rem
+        if self._step_acc >= self._step_den:
+            self._step_acc -= self._step_den
+            deadline_ns += 1
+        self._set_deadline(deadline_ns, now_ns)
+
+        self.lateness_us = late_ns // 1000
+        self.trigger(ticks_ms(), self.beat_millis)
+
+    def idle_ms(self):
+        """Milliseconds until the next internally clocked step or pending sub-step is due"""
+        if not self.playing:
+            return self.beat_millis
+        if self.ext_trigger:
+            idle = self.beat_millis
+        elif self.precise:
+            idle = ticks_diff(self._next_step_ms, ticks_ms())
+        else:
+            idle = self.beat_millis - ticks_diff(ticks_ms(), self.last_beat_millis)
+        if self.wheel.pending and self._sub < SUBSTEPS - 1:
+            sub_idle = ticks_diff(self._sub_due[self._sub + 1], ticks_ms())
+            if sub_idle < idle:
+                return sub_idle
+        return idle
 
     def toggle_play_stop(self):
         if self.playing:
-            print("Sequencer stopped.")
+            tracebuf.log(tracebuf.PLAY, 0)
             self.stop()
         else:
-            print("Sequencer playing.")
+            tracebuf.log(tracebuf.PLAY, 1)
             self.play()
 
     def stop(self):
         self.playing = False
-        self.i = 15
+        self.i = self.step_count - 1
         self.last_beat_millis = 0
+        self.wheel.clear()
 
     def pause(self):
         self.playing = False
+        self.wheel.clear()
 
     def play(self):
         self.last_beat_millis = ticks_ms() - self.beat_millis
+        now_ns = monotonic_ns()
+        self._set_deadline(now_ns, now_ns)
+        self._step_acc = 0
+        self.wheel.clear()
         self.playing = True
 
 
 class EuclideanSequencer(StepSequencer):
-    # Pre-calculated euclidean patterns
-    # Each pattern is represented as a 16-bit integer
-    # Bit 1 is hit, bit 0 is silence
-    # LSB: step 0
-    # MSB: step 16
-    EUC16 = (
-        0b0000000000000000,
-        0b0000000000000001,
-        0b0000000100000001,
-        0b0000010000100001,
-        0b0001000100010001,
-        0b0001001001001001,
-        0b0010100100101001,
-        0b0101010010101001,
-        0b0101010101010101,
-        0b0101011010101101,
-        0b1010110110101101,
-        0b1101101101101101,
-        0b1101110111011101,
-        0b1111011110111101,
-        0b1111110111111101,
-        0b0111111111111111,
-        0b1111111111111111,
-    )
+    # Patterns come from euclidean(hits, step_count), shrunk to the channel
+    # length and rotated by its offset. Each one is an integer with one bit
+    # per step, bit 1 is hit, bit 0 is silence, LSB is step 0.
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        assert self.step_count <= 16, "this sequencer supports up to 16 steps!"
-        self.sequences = [0] * MAX_SEQUENCES
+        assert self.step_count <= MAX_STEPS, f"this sequencer supports up to {MAX_STEPS} steps!"
+        self.sequences = [None] * MAX_SEQUENCES  # (hits, offsets, lengths) per slot
+        self.store = None
         self.reset()
         self.sequence_idx = 0
         self.next_sequence_idx = 0
 
+        # patterns and step tables per slot, built on load so switching is a swap
+        self._compiled = [None] * MAX_SEQUENCES
+        self._staged = None  # (slot, tables) played from the next step 0
+        self._spare = None  # tables swapped out, reused by the next _stage()
+
+        # song mode: (slot, bars) entries played in order, then from the top
+        self.chain = None
+        self.chain_pos = 0
+        self._bars_left = 0
+
+        self._snapshot = None  # boot snapshot record last written
+
+        # groove, in sub-steps (SUBSTEPS per step), played through the wheel when set
+        self.swing = 0  # odd steps this late
+        self.nudge = bytearray(self.channels)  # per voice, this late
+        self.ratchets = bytearray(1 for _ in range(self.channels))  # hits per step, per voice
+        self._groove = False
+        self._mask_events = {}  # channel mask -> (triggers, notes) for sub-steps
+
     def reset(self):
-        self.euc_idxs = bytearray(self.channels)  # EUC16 idx per channel
+        self.euc_idxs = bytearray(self.channels)  # hits per channel
         self.offsets = bytearray(self.channels)  # offset value per channel
         self.lengths = bytearray(self.step_count for _ in range(self.channels))  # step length value per channel
-        self.patterns = [0b0 for _ in range(self.channels)]  # calculated patterns (EUC16 + offset + length)
-        self._audio_triggers = bytearray(self.channels)
-        self._midi_notes = []
+        self.patterns = [0b0 for _ in range(self.channels)]  # calculated patterns (hits + offset + length)
         self.active_ch = 0
 
+        # per-step trigger table, playing a step is a lookup into these
+        self._step_triggers = [bytearray(self.channels) for _ in range(self.step_count)]
+        self._step_notes = [[] for _ in range(self.step_count)]
+        self._notes_on = tuple((ch, ch, 127) for ch in range(self.channels))
+
+    def stop(self):
+        super().stop()
+        if self.chain:
+            self.set_chain(self.chain)  # back to the top of the song
+        self.write_snapshot()
+
     def __str__(self):
+        # marker bit above the last step keeps the zero padding, [3:] drops "0b1"
+        marker = 1 << self.step_count
         return "\n".join(
-            f"ch: {ch} pattern: {pattern:016b}" for ch, pattern in enumerate(self.patterns)
+            f"ch: {ch} pattern: {bin(pattern | marker)[3:]}" for ch, pattern in enumerate(self.patterns)
         )
 
     def randomize(self, *args):
         for ch in range(self.channels):
-            self.euc_idxs[ch] = randint(0, len(self.EUC16) - 1)
+            self.euc_idxs[ch] = randint(0, self.step_count)
             self.offsets[ch] = randint(0, self.step_count)
             self.lengths[ch] = randint(self.step_count // 2, self.step_count)
             self._calculate_pattern(ch)
 
     def _calculate_pattern(self, ch):
-        idx = self.euc_idxs[ch]
-        pattern = self.EUC16[idx]
+        pattern = euclidean(self.euc_idxs[ch], self.step_count)
         pattern = self._shrink(pattern, self.lengths[ch])
-        pattern = self._rotate(pattern, self.offsets[ch])
+        pattern = self._rotate(pattern, self.offsets[ch], self.step_count)
+        changed = self.patterns[ch] ^ pattern
         self.patterns[ch] = pattern
 
+        if changed:
+            self._update_step_table(ch, changed)
+
         if ch == self.active_ch:
             self.emit(event.SEQ_PATTERN_CHANGE, pattern)
 
-        print(self, end="\n\n")
+        tracebuf.log(tracebuf.PATTERN, ch, pattern & 0x7FFFFFFF, tracebuf.DEBUG)
     
     @staticmethod
     def _shrink(pattern, n):
         return pattern & ((1 << n) - 1)
 
     @staticmethod
-    def _rotate(pattern, n):
-        n %= 16
-        return (pattern >> n) | (pattern << 16 - n) & 0xFFFF
+    def _rotate(pattern, n, steps):
+        n %= steps
+        return (pattern >> n) | (pattern << steps - n) & ((1 << steps) - 1)
+
+    def _update_step_table(self, ch, changed):
+        """refresh the trigger table rows touched by the changed bits of channel ch"""
+        pattern = self.patterns[ch]
+        for step in range(self.step_count):
+            if changed & (1 << step):
+                self._step_triggers[step][ch] = (pattern >> step) & 1
+                self._update_step_notes(step)
+
+    def _update_step_notes(self, step):
+        """note ons of a step, note offs are scheduled by the MIDI gate length"""
+        notes = self._step_notes[step]
+        notes.clear()
+        on = 1 << step
+
+        for ch, pattern in enumerate(self.patterns):
+            if pattern & on:
+                notes.append(self._notes_on[ch])
 
     def trigger_step(self):
         self.emit(event.SEQ_ACTIVE_STEP, self.i)
-        self._audio_triggers = bytearray(self.channels)
-        self._midi_notes = []
-
-        # load next sequence at step 0
-        if self.i == 0 and self.sequence_idx != self.next_sequence_idx:
-            self.sequence_idx = self.next_sequence_idx
-            self.load_sequence()
 
-        # calculate audio/midi triggers for step
-        for ch, pattern in enumerate(self.patterns):
-            step = self.i
-            hit = self._audio_triggers[ch] = (pattern & (1 << step)) > 0
-            prev_two_step = (self.i - 2) % self.step_count
-            prev_two_hit = (pattern & (1 << prev_two_step)) > 0
-
-            if prev_two_hit:
-                self._midi_notes.append((ch, ch, 0))
-            if hit:
-                self._midi_notes.append((ch, ch, 127))
-
-        self.emit(event.SEQ_STEP_TRIGGER_MIDI, self._midi_notes)
-        self.emit(event.SEQ_STEP_TRIGGER_CHANNELS, self._audio_triggers)
+        # switch to the next sequence at step 0, it was staged beforehand
+        if self.i == 0:
+            if self.sequence_idx != self.next_sequence_idx and self._staged is None:
+                self._stage(self.next_sequence_idx)
+            if self._staged is not None:
+                self._swap_staged()
+                if self.chain:
+                    self._bars_left = self.chain[self.chain_pos][1]
+            if self.chain:
+                self._bars_left -= 1
+                if self._bars_left <= 0:
+                    self._advance_chain()
+
+        if self._groove or self.wheel.pending:
+            self._trigger_groove()
+            return
+        self.emit(event.SEQ_STEP_TRIGGER_MIDI, self._step_notes[self.i])
+        self.emit(event.SEQ_STEP_TRIGGER_CHANNELS, self._step_triggers[self.i])
+
+    def _trigger_groove(self):
+        """Play what is due on the step, post swung, nudged and ratcheted hits to the wheel"""
+        triggers = self._step_triggers[self.i]
+        wheel = self.wheel
+        nudge = self.nudge
+        ratchets = self.ratchets
+        swing = self.swing if self.i & 1 else 0
+        mask = wheel.take()  # posted by earlier steps
+        for ch in range(self.channels):
+            if triggers[ch]:
+                bit = 1 << ch
+                at = swing + nudge[ch]
+                count = ratchets[ch]
+                for hit in range(count):
+                    offset = at + hit * SUBSTEPS // count
+                    if offset:
+                        wheel.post(offset, bit)
+                    else:
+                        mask |= bit
+
+        triggers, notes = self._events(mask)
+        self.emit(event.SEQ_STEP_TRIGGER_MIDI, notes)  # even when empty, MIDI gates count steps
+        self.emit(event.SEQ_STEP_TRIGGER_CHANNELS, triggers)
+
+    def trigger_substep(self, mask):
+        triggers, notes = self._events(mask)
+        self.emit(event.SEQ_STEP_TRIGGER_MIDI, notes, True)
+        self.emit(event.SEQ_STEP_TRIGGER_CHANNELS, triggers)
+
+    def _events(self, mask):
+        """(triggers, notes) of the channels in mask, built once per mask.
+
+        Only masks that get played are kept, and MASK_CACHE_SIZE of them is
+        more than a bar uses, so it only clears after many pattern changes.
+        """
+        events = self._mask_events.get(mask)
+        if events is None:
+            if len(self._mask_events) >= MASK_CACHE_SIZE:
+                self._mask_events.clear()
+            channels = range(self.channels)
+            events = (bytes(mask >> ch & 1 for ch in channels),
+                      tuple(self._notes_on[ch] for ch in channels if mask >> ch & 1))
+            self._mask_events[mask] = events
+        return events
+
+    def set_swing(self, substeps):
+        """Play odd steps 0 (straight) to SUBSTEPS // 2 sub-steps late"""
+        self.swing = max(0, min(substeps, SUBSTEPS // 2))
+        self._update_groove()
+
+    def set_nudge(self, ch, substeps):
+        """Play voice ch 0 to SUBSTEPS - 1 sub-steps late"""
+        self.nudge[ch] = max(0, min(substeps, SUBSTEPS - 1))
+        self._update_groove()
+
+    def set_ratchet(self, ch, count):
+        """Hit voice ch 1 to SUBSTEPS times per step, spread evenly over the step"""
+        self.ratchets[ch] = max(1, min(count, SUBSTEPS))
+        self._update_groove()
+
+    def _update_groove(self):
+        self._groove = bool(self.swing) or any(self.nudge) or any(count > 1 for count in self.ratchets)
     
     def update_active_voice(self, ch):
         self.active_ch = ch
         self._calculate_pattern(ch)
    
     def update_hits(self, ch, delta):
-        """set EUC16 beat index per channel, delta might be -1 or 1"""
-        self.euc_idxs[ch] = max(0, min(self.euc_idxs[ch] + delta, len(self.EUC16) - 1))
+        """set hits per channel between 0 and step_count, delta might be -1 or 1"""
+        self.euc_idxs[ch] = max(0, min(self.euc_idxs[ch] + delta, self.step_count))
         self._calculate_pattern(ch)
 
     def update_offsets(self, ch, delta):
@@ -224,60 +561,175 @@ class EuclideanSequencer(StepSequencer):
         self.lengths[ch] = max(0, min(self.lengths[ch] + delta, self.step_count))
         self._calculate_pattern(ch)
 
-    def load_sequences(self):
-        try:
-            os.stat(SEQUENCES_FILE)
-        except OSError:
-            self.save_sequence()
+    def load_sequences(self, load=True):
+        """Read and compile every slot, then switch to sequence_idx unless load
+        is False, e.g. when it already plays from the boot snapshot"""
+        self.store = store.SequenceStore(channels=self.channels, slots=MAX_SEQUENCES)
+        self.sequences = self.store.load()
+        for idx in range(MAX_SEQUENCES):
+            self._compiled[idx] = self._compile(self.sequences[idx])
+        if load:
+            self.load_sequence()
 
-        with open(SEQUENCES_FILE) as f:
-            self.sequences = json.load(f)
-        
+    def restore_snapshot(self):
+        """Load the last active sequence and tempo from the boot snapshot,
+        without reading the store. False when there is none"""
+        snapshot = store.read_snapshot(self.channels)
+        if snapshot is None or snapshot[0] >= MAX_SEQUENCES:
+            return False
+        slot, tempo, sequence = snapshot
+        self.sequences[slot] = sequence
+        self._compiled[slot] = None
+        self.sequence_idx = self.next_sequence_idx = slot
+        self.set_tempo(tempo)
         self.load_sequence()
+        return True
+
+    def write_snapshot(self, *args):
+        """Keep the boot snapshot up to date, only writes when something changed"""
+        record = store.snapshot_record(self.sequence_idx, self._tempo, self.euc_idxs, self.offsets, self.lengths)
+        if record == self._snapshot:
+            return
+        try:
+            store.write_snapshot(record)
+        except OSError:
+            return  # filesystem is mounted read only, see boot.py
+        self._snapshot = record
 
     def schedule_sequence(self, delta=0):
-        self.next_sequence_idx = (self.next_sequence_idx + delta) % self.step_count
+        self.next_sequence_idx = (self.next_sequence_idx + delta) % MAX_SEQUENCES
         self.emit(event.SEQ_SEQUENCE_SELECT, self.next_sequence_idx)
 
         if not self.playing:
             self.sequence_idx = self.next_sequence_idx
             self.load_sequence()
-        
-    def load_sequence(self):
-        print(f"loading {self.sequence_idx}...")
-        sequence = self.sequences[self.sequence_idx]
+        elif self.next_sequence_idx != self.sequence_idx:
+            self._stage(self.next_sequence_idx)
+        elif self._staged is not None:
+            # scrolled back to the playing one
+            self._spare = self._staged[1]
+            self._staged = None
 
-        # empty sequence check
-        if not sequence:
-            self.reset()
+    def load_sequence(self):
+        """Switch to sequence_idx right away"""
+        self._stage(self.sequence_idx)
+        self._swap_staged()
+
+    def _compile(self, sequence):
+        """(hits, offsets, lengths, patterns, step triggers, step notes) of a slot"""
+        channels, steps = self.channels, self.step_count
+        if sequence:
+            hits, offsets, lengths = sequence
+        else:
+            hits, offsets, lengths = bytes(channels), bytes(channels), bytes(steps for _ in range(channels))
+
+        patterns = []
+        for ch in range(channels):
+            pattern = euclidean(hits[ch], steps)
+            pattern = self._shrink(pattern, lengths[ch])
+            patterns.append(self._rotate(pattern, offsets[ch], steps))
+
+        triggers = [bytearray((pattern >> step) & 1 for pattern in patterns) for step in range(steps)]
+        notes = [[self._notes_on[ch] for ch in range(channels) if patterns[ch] >> step & 1] for step in range(steps)]
+        return bytes(hits), bytes(offsets), bytes(lengths), tuple(patterns), triggers, notes
+
+    def _stage(self, idx):
+        """Copy slot idx into the tables played next, away from the downbeat.
+
+        The tables swapped out last time are reused, only the first switch
+        allocates a set of them.
+        """
+        compiled = self._compiled[idx]
+        if compiled is None:
+            compiled = self._compiled[idx] = self._compile(self.sequences[idx])
+        hits, offsets, lengths, patterns, triggers, notes = compiled
+
+        if self._staged is not None:
+            spare = self._staged[1]
+        else:
+            spare, self._spare = self._spare, None
+        if spare is None:
+            spare = (bytearray(hits), bytearray(offsets), bytearray(lengths), list(patterns),
+                     [bytearray(row) for row in triggers], [list(row) for row in notes])
+        else:
+            spare[0][:] = hits
+            spare[1][:] = offsets
+            spare[2][:] = lengths
+            spare[3][:] = patterns
+            for step in range(self.step_count):
+                spare[4][step][:] = triggers[step]
+                spare[5][step][:] = notes[step]
+        self._staged = idx, spare
+
+    def _swap_staged(self):
+        idx, staged = self._staged
+        self._spare = self.euc_idxs, self.offsets, self.lengths, self.patterns, self._step_triggers, self._step_notes
+        self.euc_idxs, self.offsets, self.lengths, self.patterns, self._step_triggers, self._step_notes = staged
+        self._staged = None
+        self.sequence_idx = self.next_sequence_idx = idx
+        tracebuf.log(tracebuf.LOAD, idx)
+        self.emit(event.SEQ_PATTERN_CHANGE, self.patterns[self.active_ch])
+
+    def set_chain(self, chain):
+        """Play (slot, bars) entries in a loop, None goes back to single slots"""
+        self.chain = list(chain) if chain else None
+        self.chain_pos = 0
+        if not self.chain:
             return
+        self.next_sequence_idx = self.chain[0][0] % MAX_SEQUENCES
+        self.emit(event.SEQ_SEQUENCE_SELECT, self.next_sequence_idx)
+        self._stage(self.next_sequence_idx)
+        if not self.playing:
+            self._swap_staged()
+            self._bars_left = self.chain[0][1]
 
-        self.euc_idxs = bytearray(sequence["euc_idxs"])
-        self.offsets = bytearray(sequence["offsets"])
-        self.lengths = bytearray(sequence["lengths"])
+    def _advance_chain(self):
+        """Last bar of a chain entry started, stage the next one a bar ahead"""
+        self.chain_pos = (self.chain_pos + 1) % len(self.chain)
+        self.next_sequence_idx = self.chain[self.chain_pos][0] % MAX_SEQUENCES
+        self.emit(event.SEQ_SEQUENCE_SELECT, self.next_sequence_idx)
+        self._stage(self.next_sequence_idx)
 
-        for ch in range(self.channels):
-            self._calculate_pattern(ch)
-        
     def save_sequence(self):
-        was_playing = self.playing
-
-        if was_playing:
-            self.pause()
-
-        print(f"saving {self.sequence_idx}...")
+        """Save the current sequence into its slot, in place and without pausing"""
+        idx = self.sequence_idx
+        tracebuf.log(tracebuf.SAVE_START, idx)
         self.emit(event.SEQ_SEQUENCE_SAVING, True)
-        self.sequences[self.sequence_idx] = {
-            "euc_idxs": list(self.euc_idxs),
-            "offsets": list(self.offsets),
-            "lengths": list(self.lengths),
-        }
+        self.sequences[idx] = (bytearray(self.euc_idxs), bytearray(self.offsets), bytearray(self.lengths))
+        self._compiled[idx] = self._compile(self.sequences[idx])
+        if self._staged is not None and self._staged[0] == idx:
+            self._stage(idx)
 
-        with open(SEQUENCES_FILE, "wb") as f:
-            json.dump(self.sequences, f)
+        ok = 1
+        try:
+            self.store.write(idx, *self.sequences[idx])
+        except OSError:
+            ok = 0  # filesystem is mounted read only, see boot.py
 
-        print(f"saved.")
+        tracebuf.log(tracebuf.SAVE_END, idx, ok)
         self.emit(event.SEQ_SEQUENCE_SAVING, False)
+        self.write_snapshot()
+
+    def write_sequence(self, idx, sequence):
+        """Replace slot idx with (hits, offsets, lengths), or empty it with None,
+        and save it. The slot playing next switches over at step 0, right away
+        when stopped. False when the store can't be written"""
+        self.sequences[idx] = sequence
+        self._compiled[idx] = self._compile(sequence)
+        if idx == self.next_sequence_idx:
+            if self.playing:
+                self._stage(idx)
+            else:
+                self.load_sequence()
 
-        if was_playing:
-            self.play()
+        tracebuf.log(tracebuf.SAVE_START, idx)
+        ok = 1
+        try:
+            if sequence is None:
+                self.store.clear(idx)
+            else:
+                self.store.write(idx, *sequence)
+        except OSError:
+            ok = 0  # filesystem is mounted read only, see boot.py
+        tracebuf.log(tracebuf.SAVE_END, idx, ok)
+        return bool(ok)
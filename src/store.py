@@ -0,0 +1,239 @@
+import os
+import json
+
+STORE_FILE = "sequences.bin"
+JSON_FILE = "sequences.json"  # previous format, migrated on open
+MIGRATED_SUFFIX = ".migrated"  # the JSON is renamed to this once it is in the store
+SNAPSHOT_FILE = "snapshot.bin"  # last active sequence and tempo, played at boot before the store is read
+
+MAGIC = b"E16S"
+VERSION = 1
+HEADER_SIZE = 8  # magic, version, slots, channels, reserved
+USED = 0x01
+SNAPSHOT_MAGIC = b"E16B"
+
+
+def crc8(data, crc=0):
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc << 1 ^ 0x07 if crc & 0x80 else crc << 1) & 0xFF
+    return crc
+
+
+def _newer(a, b):
+    """generation a is newer than b, both wrap around at 256"""
+    return 0 < (a - b) & 0xFF < 128
+
+
+class SequenceStore:
+    """Fixed layout binary file with one record per sequence slot.
+
+    Every slot holds two copies of its record: generation, flags, hits,
+    offsets and lengths per channel, and a CRC. A save overwrites the older
+    copy in place, so a save that is cut off by power loss leaves the
+    previous one intact. Slots are (hits, offsets, lengths) bytearray
+    tuples, or None when empty.
+    """
+
+    def __init__(self, path=STORE_FILE, channels=4, slots=16, json_path=JSON_FILE):
+        self.path = path
+        self.json_path = json_path
+        self.channels = channels
+        self.slots = slots
+        self.record_size = 3 + 3 * channels  # generation, flags, data, crc
+        self._generations = bytearray(slots * 2)
+        self._valid = bytearray(slots * 2)
+        self._file = None
+
+    def _offset(self, slot, copy):
+        return HEADER_SIZE + (slot * 2 + copy) * self.record_size
+
+    def _header(self):
+        return MAGIC + bytes((VERSION, self.slots, self.channels, 0))
+
+    def load(self):
+        """Read every slot, creating or migrating the file first if needed.
+
+        A sequences.json is migrated once, then renamed out of the way: the
+        board has no clock, so file times can't tell which one is newer. A
+        JSON copied over in host mode is migrated on the next boot.
+        """
+        if self._needs_migration():
+            slots = self._read_json()
+            try:
+                self._create(slots)
+                self._retire_json()
+            except OSError:
+                # filesystem is mounted read only for us, keep serving the JSON
+                return slots
+
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+            if header[:4] != MAGIC or header[4] != VERSION:
+                raise ValueError(f"{self.path}: not a sequence store")
+            if header[5] != self.slots or header[6] != self.channels:
+                # different layout, read it as it is and rewrite in ours
+                other = SequenceStore(self.path, header[6], header[5])
+                slots = [other._pad(s, self.channels) for s in other.load()][:self.slots]
+                slots += [None] * (self.slots - len(slots))
+                f.close()
+                self._create(slots)
+                return slots
+
+            return [self._read_slot(f, slot) for slot in range(self.slots)]
+
+    def _needs_migration(self):
+        if self.json_path is None:
+            return False
+        try:
+            os.stat(self.json_path)
+            return True  # a JSON was put there (host mode), it wins
+        except OSError:
+            pass
+        try:
+            os.stat(self.path)
+            return False
+        except OSError:
+            return True  # no store yet, created empty
+
+    def _retire_json(self):
+        """Rename the migrated JSON, over the one renamed last time"""
+        try:
+            os.stat(self.json_path)
+        except OSError:
+            return  # there was none, the store was created empty
+        try:
+            os.remove(self.json_path + MIGRATED_SUFFIX)
+        except OSError:
+            pass
+        os.rename(self.json_path, self.json_path + MIGRATED_SUFFIX)
+
+    def _read_json(self):
+        try:
+            with open(self.json_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        slots = [from_json(entry, self.channels) for entry in entries[:self.slots]]
+        return slots + [None] * (self.slots - len(slots))
+
+    def _read_slot(self, f, slot):
+        found = None
+        for copy in (0, 1):
+            idx = slot * 2 + copy
+            f.seek(self._offset(slot, copy))
+            record = f.read(self.record_size)
+            valid = len(record) == self.record_size and crc8(record[:-1]) == record[-1]
+            self._valid[idx] = valid
+            self._generations[idx] = record[0] if valid else 0
+            if valid and (found is None or _newer(record[0], found[0])):
+                found = record
+
+        if found is None or not found[1] & USED:
+            return None
+        ch = self.channels
+        data = found[2:-1]
+        return bytearray(data[:ch]), bytearray(data[ch:2 * ch]), bytearray(data[2 * ch:])
+
+    def _create(self, slots):
+        with open(self.path, "wb") as f:
+            f.write(self._header())
+            f.write(bytes(self.record_size * 2 * self.slots))
+        self._valid[:] = bytes(len(self._valid))
+        self._generations[:] = bytes(len(self._generations))
+        for slot, sequence in enumerate(slots):
+            if sequence is not None:
+                self.write(slot, *sequence)
+        self.close()
+
+    @staticmethod
+    def _pad(sequence, channels):
+        if sequence is None:
+            return None
+        hits, offsets, lengths = sequence
+        pad = channels - len(hits)
+        if pad <= 0:
+            return hits[:channels], offsets[:channels], lengths[:channels]
+        default_length = max(lengths) if lengths else 16
+        return hits + bytes(pad), offsets + bytes(pad), lengths + bytes([default_length] * pad)
+
+    def write(self, slot, hits, offsets, lengths):
+        """Save one slot in place, over its older copy"""
+        self._write_record(slot, USED, bytes(hits) + bytes(offsets) + bytes(lengths))
+
+    def clear(self, slot):
+        self._write_record(slot, 0, bytes(3 * self.channels))
+
+    def _write_record(self, slot, flags, data):
+        a, b = slot * 2, slot * 2 + 1
+        gens, valid = self._generations, self._valid
+        # overwrite whichever copy is not the newest valid one
+        if valid[a] and valid[b]:
+            newest, idx = (a, b) if _newer(gens[a], gens[b]) else (b, a)
+        elif valid[a]:
+            newest, idx = a, b
+        elif valid[b]:
+            newest, idx = b, a
+        else:
+            newest, idx = None, a
+        generation = 1 if newest is None else (gens[newest] + 1) & 0xFF
+        copy = idx - a
+
+        record = bytes((generation, flags)) + data
+        record += bytes((crc8(record),))
+
+        if self._file is None:
+            self._file = open(self.path, "r+b")
+        self._file.seek(self._offset(slot, copy))
+        self._file.write(record)
+        self._file.flush()
+
+        gens[idx] = generation
+        valid[idx] = 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def from_json(entry, channels):
+    """sequences.json entry (dict or 0 for empty) to a store slot"""
+    if not entry:
+        return None
+    return SequenceStore._pad(
+        (bytearray(entry["euc_idxs"]), bytearray(entry["offsets"]), bytearray(entry["lengths"])),
+        channels,
+    )
+
+
+def snapshot_record(slot, tempo, hits, offsets, lengths):
+    """Boot snapshot: magic, version, slot, channels, milli-BPM tempo, data and a CRC"""
+    record = SNAPSHOT_MAGIC + bytes((VERSION, slot, len(hits))) + round(tempo * 1000).to_bytes(4, "little")
+    record += bytes(hits) + bytes(offsets) + bytes(lengths)
+    return record + bytes((crc8(record),))
+
+
+def write_snapshot(record, path=SNAPSHOT_FILE):
+    with open(path, "wb") as f:
+        f.write(record)
+
+
+def read_snapshot(channels, path=SNAPSHOT_FILE):
+    """(slot, tempo, (hits, offsets, lengths)) from the boot snapshot, None if missing or damaged"""
+    try:
+        with open(path, "rb") as f:
+            record = f.read()
+    except OSError:
+        return None
+    if len(record) < 12 or record[:4] != SNAPSHOT_MAGIC or record[4] != VERSION:
+        return None
+    ch = record[6]
+    if len(record) != 12 + 3 * ch or crc8(record[:-1]) != record[-1]:
+        return None
+    milli = int.from_bytes(record[7:11], "little")
+    tempo = milli // 1000 if milli % 1000 == 0 else milli / 1000
+    data = record[11:-1]
+    sequence = bytearray(data[:ch]), bytearray(data[ch:2 * ch]), bytearray(data[2 * ch:])
+    return record[5], tempo, SequenceStore._pad(sequence, channels)
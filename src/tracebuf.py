@@ -0,0 +1,92 @@
+import struct
+import sys
+from binascii import hexlify
+
+from adafruit_ticks import ticks_ms
+
+# levels
+DEBUG = 0
+INFO = 1
+WARN = 2
+
+# record codes, (a, b) meaning in the comment
+STEP = 1  # (step, lateness us)
+EVENT = 2  # (event id, first int arg)
+LOAD = 3  # (sequence idx, 0)
+SAVE_START = 4  # (sequence idx, 0)
+SAVE_END = 5  # (sequence idx, ok)
+PATTERN = 6  # (channel, pattern low 32 bits)
+TEMPO = 7  # (bpm, step us)
+SYNC = 8  # (1 external / 0 internal, 0)
+PLAY = 9  # (1 playing / 0 stopped, 0)
+GC = 10  # (collect us, bytes free after)
+ALLOC = 11  # (step, bytes allocated since the last check)
+BOOT = 12  # (boot stage, ms since reset)
+
+RECORD = "<IBBHi"  # ticks ms, code, level, a, b
+RECORD_SIZE = struct.calcsize(RECORD)
+LINE_PREFIX = b"#T "
+DROPPED_PREFIX = b"#D "
+
+
+class TraceBuffer:
+    """Fixed ring of binary trace records.
+
+    log() only packs 12 bytes into a preallocated buffer, drain() writes
+    pending records to the console as "#T <hex>" lines and is meant to be
+    called when the sequencer is idle. tools/tracedump.py decodes them.
+    """
+
+    def __init__(self, records=256, level=INFO, out=None):
+        self.level = level
+        self.records = records
+        self.dropped = 0
+        self._buf = bytearray(records * RECORD_SIZE)
+        self._mv = memoryview(self._buf)
+        self._head = 0  # next record to write
+        self._count = 0  # records waiting for drain
+        self._out = out
+
+    def log(self, code, a=0, b=0, level=INFO):
+        if level < self.level:
+            return
+        struct.pack_into(RECORD, self._buf, self._head * RECORD_SIZE,
+                         ticks_ms(), code, level, a & 0xFFFF, max(-0x80000000, min(b, 0x7FFFFFFF)))
+        self._head = (self._head + 1) % self.records
+        if self._count < self.records:
+            self._count += 1
+        else:
+            self.dropped += 1
+
+    def pending(self):
+        return self._count
+
+    def drain(self, max_records=16):
+        """Write up to max_records of the oldest pending records, returns how many"""
+        out = self._out or sys.stdout
+        if self.dropped:
+            out.write(DROPPED_PREFIX.decode() + str(self.dropped) + "\n")
+            self.dropped = 0
+
+        n = min(self._count, max_records)
+        if not n:
+            return 0
+
+        # oldest pending record, only write up to the end of the ring this time
+        tail = (self._head - self._count) % self.records
+        n = min(n, self.records - tail)
+        chunk = self._mv[tail * RECORD_SIZE:(tail + n) * RECORD_SIZE]
+        out.write(LINE_PREFIX.decode() + hexlify(chunk).decode() + "\n")
+        self._count -= n
+        return n
+
+
+def decode(data):
+    """Yield (ticks ms, code, level, a, b) from packed records"""
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        yield struct.unpack_from(RECORD, data, offset)
+
+
+buffer = TraceBuffer()
+log = buffer.log
+drain = buffer.drain
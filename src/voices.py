@@ -0,0 +1,90 @@
+NO_TRACK = 0xFF
+
+
+class VoicePool:
+    """Plays any number of tracks on the few voices of an audiomixer.Mixer.
+
+    A track hit again restarts on the voice it already has, like a drum
+    choke. Otherwise it takes a free voice or, when every voice is busy,
+    steals one: the voice playing the lowest priority track, the one that
+    started first among equals. Levels are only written to a voice when
+    they change. Nothing is allocated per trigger.
+    """
+
+    def __init__(self, mixer, tracks, level=0.8, priorities=None):
+        self.voices = mixer.voice
+        self.tracks = tracks
+        self.levels = [level] * tracks
+        self.priorities = bytearray(priorities or tracks)  # higher is kept longer
+        self.steals = 0
+
+        count = len(self.voices)
+        self._owner = bytearray(NO_TRACK for _ in range(count))  # track per voice
+        self._voice = bytearray(NO_TRACK for _ in range(tracks))  # voice per track
+        self._started = [0] * count  # play counter when each voice started
+        self._level = [None] * count  # last level written per voice
+        self._sample = [None] * count  # last sample played per voice
+        self._plays = 0
+
+    def set_level(self, track, level):
+        self.levels[track] = level
+
+    def set_priority(self, track, priority):
+        self.priorities[track] = priority
+
+    def _allocate(self, track):
+        voice = self._voice[track]
+        if voice != NO_TRACK and self._owner[voice] == track:
+            return voice
+
+        voices = self.voices
+        owner = self._owner
+        priorities = self.priorities
+        started = self._started
+        best = -1
+        for idx in range(len(voices)):
+            if owner[idx] == NO_TRACK or not voices[idx].playing:
+                best = idx
+                break
+            if best < 0:
+                best = idx
+                continue
+            priority, best_priority = priorities[owner[idx]], priorities[owner[best]]
+            if priority < best_priority or priority == best_priority and started[idx] < started[best]:
+                best = idx
+        else:
+            self.steals += 1
+
+        previous = owner[best]
+        if previous != NO_TRACK:
+            self._voice[previous] = NO_TRACK
+        owner[best] = track
+        self._voice[track] = best
+        return best
+
+    def play(self, track, sample):
+        voice = self._allocate(track)
+        mixer_voice = self.voices[voice]
+        level = self.levels[track]
+        if self._level[voice] != level:
+            mixer_voice.level = level
+            self._level[voice] = level
+        self._plays += 1
+        self._started[voice] = self._plays
+        self._sample[voice] = sample
+        mixer_voice.play(sample)
+
+    def playing(self, sample):
+        """True while a voice still plays sample"""
+        voices = self.voices
+        for idx in range(len(voices)):
+            if self._sample[idx] is sample and voices[idx].playing:
+                return True
+        return False
+
+    def trigger(self, triggers, samples):
+        """Play samples[track] for every track set in triggers, one step worth.
+        Tracks without a sample yet, while the pack loads, stay silent"""
+        for track in range(self.tracks):
+            if triggers[track] and samples[track] is not None:
+                self.play(track, samples[track])
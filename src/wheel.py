@@ -0,0 +1,37 @@
+class TimingWheel:
+    """Fixed ring of channel masks, one slot per sub-step.
+
+    post() ORs a mask into the slot `offset` sub-steps after the current
+    one, advance() moves on one slot and take() hands back what was posted
+    to the current one, clearing it. Masks are small ints and the ring is
+    allocated once, so nothing is allocated per event. Offsets wrap at
+    `slots`, post at most slots - 1 ahead.
+    """
+
+    def __init__(self, slots=16):
+        self.slots = slots
+        self.pending = 0  # slots holding a mask
+        self._masks = [0] * slots
+        self._pos = 0
+
+    def post(self, offset, mask):
+        idx = (self._pos + min(offset, self.slots - 1)) % self.slots
+        if not self._masks[idx]:
+            self.pending += 1
+        self._masks[idx] |= mask
+
+    def take(self):
+        """Mask of the current slot, cleared"""
+        mask = self._masks[self._pos]
+        if mask:
+            self._masks[self._pos] = 0
+            self.pending -= 1
+        return mask
+
+    def advance(self):
+        self._pos = (self._pos + 1) % self.slots
+
+    def clear(self):
+        for idx in range(self.slots):
+            self._masks[idx] = 0
+        self.pending = 0
@@ -0,0 +1,340 @@
+"""Benchmark the firmware hot paths on the host and compare against a baseline.
+
+    python tools/bench.py
+    python tools/bench.py --update-baseline
+    python tools/bench.py -k midi --speed --threshold 0.4
+
+Every benchmark runs firmware code as it is, on top of the stand-ins in
+tools/hostsim. Reported per benchmark: calls per second (best of --repeat
+runs) and bytes allocated per call, from tracemalloc's peak during the
+call. Host numbers are not device numbers, what matters is how they move.
+
+The run fails (exit status 1) when a benchmark allocates more than in
+tools/bench_baseline.json, which is committed: allocations are the same
+on every machine. Hot paths, the ones that allocate nothing on the
+device, may only go HOT_PATH_SLACK bytes over it, the others --threshold.
+Speed differs between machines, so it is only checked with --speed,
+against bench_speed-<host>.json recorded on this machine (not committed):
+then a benchmark slower than that by more than --threshold fails too.
+--update-baseline records both.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import hostsim
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "bench_baseline.json")  # allocations, committed
+SPEED_BASELINE = os.path.join(HERE, f"bench_speed-{platform.node() or 'local'}.json")  # this machine only
+CHANNELS = 8
+ALLOC_SLACK = 16  # bytes per call tolerated on top of the threshold, for interpreter noise
+HOT_PATH_SLACK = 8  # bytes per call a hot path may go over its baseline, less than any new object
+
+BENCHMARKS = {}
+HOT_PATHS = set()
+
+
+def benchmark(func):
+    """Register a benchmark: func() does the setup and returns the callable to time"""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def hot_path(func):
+    """Register a benchmark of code that allocates nothing on the device,
+    what it allocates here is the host's own and must not grow"""
+    HOT_PATHS.add(func.__name__)
+    return benchmark(func)
+
+
+class NullPort:
+    """MIDI out that drops what it gets, the stand-in keeps a log that grows"""
+
+    def write(self, buf):
+        return len(buf)
+
+
+def _sequencer(patterns=True):
+    import sequencer
+
+    random.seed(0)
+    seq = sequencer.EuclideanSequencer(channels=CHANNELS, step_count=16)
+    if patterns:
+        seq.randomize()
+    return seq
+
+
+def _wired(seq, handlers=2):
+    """Subscribe no-op handlers to the step events, like main.py's fan-out"""
+    import event
+
+    for idx in range(handlers):
+        for ev in (event.SEQ_ACTIVE_STEP, event.SEQ_STEP_TRIGGER_MIDI,
+                   event.SEQ_STEP_TRIGGER_CHANNELS, event.SEQ_PATTERN_CHANGE):
+            seq.register(ev, lambda *args: None)
+    seq.compile()
+    return seq
+
+
+@hot_path
+def trigger_step():
+    seq = _wired(_sequencer())
+
+    def run():
+        seq.trigger_step()
+        seq.i = (seq.i + 1) % seq.step_count
+    return run
+
+
+@hot_path
+def trigger_groove():
+    seq = _wired(_sequencer())
+    seq.set_swing(1)
+    seq.set_nudge(1, 1)
+    seq.set_ratchet(0, 2)
+
+    def run():
+        # the step and the sub-steps it posts
+        seq.trigger_step()
+        while seq.wheel.pending:
+            seq.wheel.advance()
+            mask = seq.wheel.take()
+            if mask:
+                seq.trigger_substep(mask)
+        seq.i = (seq.i + 1) % seq.step_count
+    return run
+
+
+@benchmark
+def calculate_pattern():
+    seq = _wired(_sequencer())
+    state = {"ch": 0}
+
+    def run():
+        ch = state["ch"] = (state["ch"] + 1) % CHANNELS
+        seq.update_hits(ch, 1 if seq.euc_idxs[ch] < seq.step_count else -seq.step_count)
+    return run
+
+
+@benchmark
+def edit_flush():
+    from edits import EditQueue
+
+    seq = _wired(_sequencer())
+    edits = EditQueue(seq, CHANNELS)
+    state = {"sign": 1}
+
+    def run():
+        # a fast turn: several deltas on one voice, then one frame
+        sign = state["sign"] = -state["sign"]
+        for _ in range(4):
+            edits.hits(0, sign)
+        edits.offsets(1, sign)
+        edits.flush()
+    return run
+
+
+@benchmark
+def randomize():
+    seq = _wired(_sequencer())
+    return seq.randomize
+
+
+@hot_path
+def load_sequence():
+    seq = _wired(_sequencer())
+    seq.sequences[0] = (bytearray(seq.euc_idxs), bytearray(seq.offsets), bytearray(seq.lengths))
+    seq.randomize()
+    seq.sequences[1] = (bytearray(seq.euc_idxs), bytearray(seq.offsets), bytearray(seq.lengths))
+
+    def run():
+        seq.sequence_idx ^= 1  # alternate so every load changes the patterns
+        seq.load_sequence()
+    return run
+
+
+@hot_path
+def emit_fanout():
+    import event
+
+    emitter = event.EventEmitter()
+    for _ in range(8):
+        emitter.register(event.SEQ_ACTIVE_STEP, lambda step: None)
+    emitter.compile(instrument=False, trace=False)
+
+    def run():
+        emitter.emit(event.SEQ_ACTIVE_STEP, 3)
+    return run
+
+
+@hot_path
+def midi_trigger_notes():
+    from midi import MIDI
+
+    seq = _sequencer()
+    midi = MIDI(channels=CHANNELS)
+    midi.midi_out = NullPort()
+    steps = seq._step_notes
+    state = {"i": 0}
+
+    def run():
+        i = state["i"] = (state["i"] + 1) % len(steps)
+        midi.trigger_notes(steps[i])
+    return run
+
+
+@hot_path
+def led_update():
+    import interface
+
+    leds = interface.LED()
+    seq = _sequencer()
+    leds.update_pattern(seq.patterns[0])
+    state = {"i": 0}
+
+    def run():
+        i = state["i"] = (state["i"] + 1) % 16
+        leds.next_step(i)
+        leds.flush()
+    return run
+
+
+def ops_per_second(run, min_time, repeat):
+    # calibrate a batch size that takes at least min_time
+    n = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(n):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        n *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(n):
+            run()
+        best = min(best, time.perf_counter() - started)
+    return n / best
+
+
+def allocated_bytes(run, calls=200):
+    """Mean peak bytes allocated during one call"""
+    run()  # first call may fill caches
+    tracemalloc.start()
+    total = 0
+    try:
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run()
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / calls
+
+
+def measure(names, min_time, repeat):
+    hostsim.install()
+    results = {}
+    for name in names:
+        run = BENCHMARKS[name]()
+        results[name] = {
+            "ops_per_sec": round(ops_per_second(run, min_time, repeat), 1),
+            "alloc_bytes": round(allocated_bytes(run), 1),
+        }
+    return results
+
+
+def compare(results, baseline, speed_baseline, threshold):
+    """(name, message) for every regression, speed only against a speed baseline"""
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None:
+            if name in HOT_PATHS:
+                limit = base["alloc_bytes"] + HOT_PATH_SLACK
+            else:
+                limit = base["alloc_bytes"] * (1 + threshold) + ALLOC_SLACK
+            if result["alloc_bytes"] > limit:
+                failures.append((name, f"{result['alloc_bytes']:.0f} B/call, baseline {base['alloc_bytes']:.0f}"))
+        speed = speed_baseline.get(name)
+        if speed is not None and result["ops_per_sec"] < speed["ops_per_sec"] * (1 - threshold):
+            failures.append((name, f"{result['ops_per_sec']:.0f} ops/s, baseline {speed['ops_per_sec']:.0f} "
+                                   f"on this machine"))
+    return failures
+
+
+def load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def save(path, entries):
+    with open(path, "w") as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"baseline written to {path}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="", help="only benchmarks with this in their name")
+    parser.add_argument("--baseline", default=BASELINE, help="allocation baseline JSON file")
+    parser.add_argument("--speed-baseline", default=SPEED_BASELINE, help="this machine's speed baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baselines")
+    parser.add_argument("--threshold", type=float, default=0.4, help="tolerated regression, 0.4 = 40%%")
+    parser.add_argument("--speed", action="store_true", help="fail on speed as well, against this machine's baseline")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark, the best counts")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.pattern in name]
+    results = measure(names, args.min_time, args.repeat)
+
+    baseline = load(args.baseline)
+    speed_baseline = load(args.speed_baseline)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        # baseline and change are against this machine's speed baseline
+        print(f"{'benchmark':<20} {'ops/s':>12} {'baseline':>12} {'change':>8} {'B/call':>8}")
+        for name, result in results.items():
+            base = speed_baseline.get(name)
+            if base:
+                change = f"{(result['ops_per_sec'] / base['ops_per_sec'] - 1) * 100:+.0f}%"
+                base_ops = f"{base['ops_per_sec']:.0f}"
+            else:
+                change = base_ops = "-"
+            print(f"{name:<20} {result['ops_per_sec']:>12.0f} {base_ops:>12} {change:>8} {result['alloc_bytes']:>8.0f}")
+
+    if args.update_baseline:
+        baseline.update({name: {"alloc_bytes": result["alloc_bytes"]} for name, result in results.items()})
+        save(args.baseline, baseline)
+        speed_baseline.update({name: {"ops_per_sec": result["ops_per_sec"]} for name, result in results.items()})
+        save(args.speed_baseline, speed_baseline)
+        return
+
+    if args.speed and not speed_baseline:
+        sys.exit(f"no speed baseline for this machine in {args.speed_baseline}, record one with --update-baseline")
+    failures = compare(results, baseline, speed_baseline if args.speed else {}, args.threshold)
+    for name, message in failures:
+        print(f"REGRESSION {name}: {message}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
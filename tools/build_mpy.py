@@ -0,0 +1,83 @@
+"""Precompile the firmware modules to .mpy, so the board doesn't compile them at boot.
+
+    python tools/build_mpy.py
+    python tools/build_mpy.py --drive /media/$USER/CIRCUITPY
+    python tools/build_mpy.py --mpy-cross ~/bin/mpy-cross-9.2 -O 1
+
+CircuitPython compiles every .py module when it is imported, and at boot
+that takes longer than running the code. Every module in src/ is compiled
+with mpy-cross into --out, except boot.py and main.py, which the board
+only runs as source. The .mpy format has to match the firmware, use the
+mpy-cross built for the CircuitPython version on the board: an
+incompatible file fails on import with "Incompatible .mpy file".
+
+--drive copies the .mpy files, main.py and boot.py to the mounted board and
+deletes the .py of every compiled module there, a .py next to its .mpy is
+the one that gets imported. samplepack/, lib/ and the sequence store are
+left alone.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+OUT = os.path.abspath(os.path.join(SRC, "..", "build"))
+SOURCE_ONLY = ("boot.py", "main.py")
+
+
+def modules(src):
+    return sorted(f for f in os.listdir(src) if f.endswith(".py") and f not in SOURCE_ONLY)
+
+
+def build(mpy_cross, src, out, optimize):
+    """Compile every module, returns the .mpy file names"""
+    os.makedirs(out, exist_ok=True)
+    built = []
+    for filename in modules(src):
+        target = filename[:-3] + ".mpy"
+        # -s keeps tracebacks pointing at the module, not at this machine's path
+        cmd = [mpy_cross, f"-O{optimize}", "-s", filename, "-o", os.path.join(out, target),
+               os.path.join(src, filename)]
+        subprocess.run(cmd, check=True)
+        built.append(target)
+        size = os.path.getsize(os.path.join(src, filename)), os.path.getsize(os.path.join(out, target))
+        print(f"{filename:<16} {size[0]:>7} B -> {target:<16} {size[1]:>7} B")
+    return built
+
+
+def install(built, src, out, drive):
+    for target in built:
+        shutil.copyfile(os.path.join(out, target), os.path.join(drive, target))
+        stale = os.path.join(drive, target[:-4] + ".py")
+        if os.path.exists(stale):
+            os.remove(stale)
+    for filename in SOURCE_ONLY:
+        shutil.copyfile(os.path.join(src, filename), os.path.join(drive, filename))
+    print(f"{len(built)} modules, {', '.join(SOURCE_ONLY)} copied to {drive}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross executable matching the firmware")
+    parser.add_argument("--src", default=SRC, help="firmware sources")
+    parser.add_argument("--out", default=OUT, help="where the .mpy files go")
+    parser.add_argument("-O", dest="optimize", type=int, default=0,
+                        help="optimization level, 1 and up drop asserts and line numbers")
+    parser.add_argument("--drive", help="mounted CIRCUITPY drive to install to")
+    args = parser.parse_args()
+
+    try:
+        built = build(args.mpy_cross, args.src, args.out, args.optimize)
+    except FileNotFoundError:
+        sys.exit(f"{args.mpy_cross} not found, see --mpy-cross")
+    except subprocess.CalledProcessError as e:
+        sys.exit(e.returncode)
+
+    if args.drive:
+        install(built, args.src, args.out, args.drive)
+
+
+if __name__ == "__main__":
+    main()
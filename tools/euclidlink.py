@@ -0,0 +1,292 @@
+"""Read and write sequences, sample packs and live parameters over USB, while the device plays.
+
+    python tools/euclidlink.py --port /dev/ttyACM1 info
+    python tools/euclidlink.py --port /dev/ttyACM1 pull backup.json
+    python tools/euclidlink.py --port /dev/ttyACM1 --port /dev/ttyACM3 push src/sequences.json
+    python tools/euclidlink.py --port /dev/ttyACM1 upload-pack src/samplepack/909 --swap
+    python tools/euclidlink.py --port /dev/ttyACM1 groove --swing 1 --ratchet 0:2,3:4
+
+Talks to src/cdc.py on the second serial port the device shows when boot.py
+enables the USB data channel, next to the console (needs pyserial). Nothing
+has to be remounted: the device writes its own store and packs, in small
+pieces between steps. Every --port gets the same command, one after the
+other, e.g. to provision several boxes in one go.
+
+EuclidLink is the client library, it works on any object with pyserial's
+read() and write().
+"""
+import argparse
+import json
+import os
+import sys
+
+import hostsim
+
+hostsim.install()  # the protocol constants and framing come from the firmware
+import cdc
+import store
+from midiexport import load_slots, parse_chain
+from samples import MANIFEST
+
+TIMEOUT = 2  # seconds to wait for a reply, a store write can take a while
+
+
+class LinkError(Exception):
+    def __init__(self, command, status, message):
+        super().__init__(f"command {command}: status {status}, {message}")
+        self.status = status
+
+
+class EuclidLink:
+    """Client for the protocol in src/cdc.py"""
+
+    def __init__(self, port):
+        self.port = port
+        info = self.request(cdc.INFO)
+        if info[0] != cdc.VERSION:
+            raise LinkError(cdc.INFO, cdc.BAD_REQUEST, f"device speaks version {info[0]}, this is {cdc.VERSION}")
+        self.channels, self.slots, self.steps = info[1], info[2], info[3]
+        self.max_payload = int.from_bytes(info[4:6], "little")
+        self.record_size = 1 + 3 * self.channels
+
+    def request(self, command, payload=b""):
+        """Send one command, returns the reply data or raises LinkError"""
+        frame = bytes((cdc.SYNC, command)) + len(payload).to_bytes(2, "little") + bytes(payload)
+        self.port.write(frame + bytes((store.crc8(frame[1:]),)))
+
+        while True:
+            sync = self.port.read(1)
+            if not sync:
+                raise TimeoutError(f"command {command}: no reply")
+            if sync[0] == cdc.SYNC:
+                break
+        header = self._read(3)
+        body = self._read((header[1] | header[2] << 8) + 1)
+        if store.crc8(header + body[:-1]) != body[-1]:
+            raise LinkError(command, cdc.BAD_FRAME, "reply CRC mismatch")
+        if header[0] != command:
+            raise LinkError(command, cdc.BAD_FRAME, f"reply to command {header[0]}")
+        status, data = body[0], body[1:-1]
+        if status != cdc.OK:
+            raise LinkError(command, status, data.decode(errors="replace"))
+        return data
+
+    def _read(self, n):
+        data = self.port.read(n)
+        if len(data) < n:
+            raise TimeoutError("reply cut off")
+        return data
+
+    def info(self):
+        return {"channels": self.channels, "slots": self.slots, "steps": self.steps,
+                "max_payload": self.max_payload}
+
+    def _per_frame(self):
+        return (self.max_payload - 3) // self.record_size
+
+    def read_slots(self):
+        """Every slot as (hits, offsets, lengths), None when empty"""
+        ch, slots = self.channels, []
+        for first in range(0, self.slots, self._per_frame()):
+            count = min(self._per_frame(), self.slots - first)
+            data = self.request(cdc.READ_SLOTS, bytes((first, count)))
+            for idx in range(count):
+                record = data[2 + idx * self.record_size:2 + (idx + 1) * self.record_size]
+                used = record[0] & store.USED
+                slots.append((record[1:1 + ch], record[1 + ch:1 + 2 * ch], record[1 + 2 * ch:]) if used else None)
+        return slots
+
+    def write_slots(self, slots, first=0):
+        """Store (hits, offsets, lengths) or None per slot, from slot `first` on"""
+        for start in range(0, len(slots), self._per_frame()):
+            chunk = slots[start:start + self._per_frame()]
+            payload = bytearray((first + start, len(chunk)))
+            for sequence in chunk:
+                sequence = store.SequenceStore._pad(sequence, self.channels)
+                if sequence is None:
+                    payload += bytes(self.record_size)
+                else:
+                    payload.append(store.USED)
+                    for values in sequence:
+                        payload += bytes(values)
+            self.request(cdc.WRITE_SLOTS, payload)
+
+    def state(self):
+        data, ch = self.request(cdc.GET_STATE), self.channels
+        at = 8 + 2 * ch
+        chain = [(data[at + 1 + 2 * idx], data[at + 2 + 2 * idx]) for idx in range(data[at])]
+        return {
+            "playing": bool(data[0]),
+            "slot": data[1],
+            "next_slot": data[2],
+            "tempo": int.from_bytes(data[3:7], "little") / 1000,
+            "swing": data[7],
+            "nudge": list(data[8:8 + ch]),
+            "ratchets": list(data[8 + ch:8 + 2 * ch]),
+            "chain": chain,
+            "pack": data[at + 1 + 2 * len(chain):].decode(),
+        }
+
+    def set_tempo(self, bpm):
+        self.request(cdc.SET_TEMPO, round(bpm * 1000).to_bytes(4, "little"))
+
+    def set_groove(self, swing, nudge, ratchets):
+        self.request(cdc.SET_GROOVE, bytes([swing] + list(nudge) + list(ratchets)))
+
+    def select(self, slot):
+        self.request(cdc.SELECT_SLOT, bytes((slot,)))
+
+    def set_chain(self, chain):
+        """(slot, bars) entries, empty for single slots"""
+        self.request(cdc.SET_CHAIN, bytes(value for entry in chain for value in entry))
+
+    def play(self):
+        self.request(cdc.TRANSPORT, b"\x01")
+
+    def stop(self):
+        self.request(cdc.TRANSPORT, b"\x00")
+
+    def packs(self):
+        data = self.request(cdc.LIST_PACKS).decode()
+        return data.split("\n") if data else []
+
+    def read_file(self, path):
+        """Contents of "pack/file" on the device"""
+        data = bytearray()
+        while True:
+            reply = self.request(cdc.READ_FILE, len(data).to_bytes(4, "little") + path.encode())
+            size, chunk = int.from_bytes(reply[:4], "little"), reply[4:]
+            data += chunk
+            if len(data) >= size or not chunk:
+                return bytes(data)
+
+    def write_file(self, path, data):
+        name = path.encode()
+        room = self.max_payload - 5 - len(name)
+        offset = 0
+        while True:
+            chunk = data[offset:offset + room]
+            self.request(cdc.WRITE_FILE, offset.to_bytes(4, "little") + bytes((len(name),)) + name + chunk)
+            offset += len(chunk)
+            if offset >= len(data):
+                return
+
+    def manifest(self, pack):
+        return json.loads(self.read_file(f"{pack}/{MANIFEST}"))
+
+    def upload_pack(self, folder, name=None):
+        """Copy a pack made by tools/packer.py, the manifest goes last so the
+        device refuses the pack until it is complete"""
+        name = name or os.path.basename(os.path.normpath(folder))
+        with open(os.path.join(folder, MANIFEST)) as f:
+            manifest = json.load(f)
+        for sample in manifest["samples"]:
+            with open(os.path.join(folder, sample["file"]), "rb") as f:
+                self.write_file(f"{name}/{sample['file']}", f.read())
+        with open(os.path.join(folder, MANIFEST), "rb") as f:
+            self.write_file(f"{name}/{MANIFEST}", f.read())
+        return name
+
+    def swap(self, pack):
+        self.request(cdc.SWAP_PACK, pack.encode())
+
+
+def to_json(sequence):
+    """Store slot to a sequences.json entry"""
+    if sequence is None:
+        return 0
+    hits, offsets, lengths = sequence
+    return {"euc_idxs": list(hits), "offsets": list(offsets), "lengths": list(lengths)}
+
+
+def voice_values(text, channels, default):
+    """"0:2,3:4" to one value per voice, default for the others"""
+    values = [default] * channels
+    for ch, value in parse_chain(text or ""):
+        values[ch] = value
+    return values
+
+
+def run(link, args):
+    if args.command == "info":
+        print(json.dumps(link.info()))
+    elif args.command == "state":
+        print(json.dumps(link.state()))
+    elif args.command == "pull":
+        with open(args.file, "w") as f:
+            json.dump([to_json(sequence) for sequence in link.read_slots()], f, separators=(",", ":"))
+        print(f"{link.slots} slots written to {args.file}")
+    elif args.command == "push":
+        slots = load_slots(args.file, link.channels)[:link.slots]
+        link.write_slots(slots)
+        print(f"{sum(sequence is not None for sequence in slots)} sequences stored")
+    elif args.command == "tempo":
+        link.set_tempo(args.bpm)
+    elif args.command == "groove":
+        state = link.state()
+        link.set_groove(state["swing"] if args.swing is None else args.swing,
+                        voice_values(args.nudge, link.channels, 0) if args.nudge is not None else state["nudge"],
+                        voice_values(args.ratchet, link.channels, 1) if args.ratchet is not None else state["ratchets"])
+    elif args.command == "select":
+        link.select(args.slot)
+    elif args.command == "chain":
+        link.set_chain(parse_chain(args.chain) if args.chain else [])
+    elif args.command == "play":
+        link.play()
+    elif args.command == "stop":
+        link.stop()
+    elif args.command == "packs":
+        print("\n".join(link.packs()))
+    elif args.command == "manifest":
+        print(json.dumps(link.manifest(args.pack), indent=1))
+    elif args.command == "upload-pack":
+        name = link.upload_pack(args.folder, args.name)
+        print(f"{name} uploaded")
+        if args.swap:
+            link.swap(name)
+    elif args.command == "swap":
+        link.swap(args.pack)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", action="append", required=True,
+                        help="the device's data serial port (not the console), repeat for several devices")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="protocol version and layout")
+    commands.add_parser("state", help="transport, slot, tempo, groove, chain and pack")
+    commands.add_parser("pull", help="save every slot to a sequences.json").add_argument("file")
+    commands.add_parser("push", help="store every slot of a sequences.json or sequences.bin").add_argument("file")
+    commands.add_parser("tempo", help="set the tempo").add_argument("bpm", type=float)
+    groove = commands.add_parser("groove", help="set swing, nudge and ratchets, the rest stays")
+    groove.add_argument("--swing", type=int, help="odd steps late, in quarter steps (0-2)")
+    groove.add_argument("--nudge", help="voice:quarter steps late, e.g. 0:1,2:3, other voices 0")
+    groove.add_argument("--ratchet", help="voice:hits per step, e.g. 0:2,3:4, other voices 1")
+    commands.add_parser("select", help="play a slot from the next bar").add_argument("slot", type=int)
+    commands.add_parser("chain", help="play slot:bars entries, none for single slots").add_argument("chain", nargs="?")
+    commands.add_parser("play")
+    commands.add_parser("stop")
+    commands.add_parser("packs", help="list the sample packs")
+    commands.add_parser("manifest", help="print a pack's manifest.json").add_argument("pack")
+    upload = commands.add_parser("upload-pack", help="copy a pack made by tools/packer.py")
+    upload.add_argument("folder")
+    upload.add_argument("--name", help="pack name on the device, the folder name by default")
+    upload.add_argument("--swap", action="store_true", help="play it once it is there")
+    commands.add_parser("swap", help="switch to another sample pack").add_argument("pack")
+    args = parser.parse_args()
+
+    import serial
+
+    failed = 0
+    for name in args.port:
+        try:
+            with serial.Serial(name, 115200, timeout=TIMEOUT) as port:
+                run(EuclidLink(port), args)
+        except (LinkError, TimeoutError, OSError) as e:
+            print(f"{name}: {e}", file=sys.stderr)
+            failed += 1
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Host stand-ins for the CircuitPython modules used by euclid-16.
+
+Call install() before importing anything from src/ so that `board`,
+`digitalio`, `adafruit_ticks`, etc. resolve to the modules in stubs/,
+all of them driven by the shared virtual clock in hostsim.clock.
+"""
+import gc
+import os
+import sys
+import time
+
+from hostsim.clock import clock
+from hostsim.heap import heap
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUBS = os.path.join(HERE, "stubs")
+SRC = os.path.abspath(os.path.join(HERE, "..", "..", "src"))
+
+
+def install(src=SRC):
+    """Put the stand-ins and the firmware sources on sys.path.
+
+    time.monotonic/monotonic_ns/sleep are pointed at the virtual clock as well,
+    and gc gets CircuitPython's mem_alloc/mem_free from hostsim.heap. They
+    are builtins on both sides so there is no stub module for them.
+    """
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.now_ns
+    time.sleep = clock.sleep
+    gc.mem_alloc = heap.mem_alloc
+    gc.mem_free = heap.mem_free
+    gc.collect = heap.collect
+    for path in (src, STUBS):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    return clock
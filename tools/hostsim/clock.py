@@ -0,0 +1,50 @@
+import time
+
+
+class SimulationDone(Exception):
+    """Raised from a clock read once the virtual deadline has passed"""
+
+
+class VirtualClock:
+    """Controllable nanosecond clock shared by every stand-in module.
+
+    Time only moves when someone asks it to:
+      - advance(ns) moves it explicitly (the simulator does this once per loop)
+      - read_ns is added on every read, modelling the cost of the call itself
+      - cost_scale > 0 adds the host time spent between two reads, scaled, so
+        slower code shows up as slower virtual time (e.g. 20.0 ~ RP2040 vs x86)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, read_ns=0, cost_scale=0.0, until_ns=None):
+        self.ns = 0
+        self.read_ns = read_ns
+        self.cost_scale = cost_scale
+        self.until_ns = until_ns
+        self._host_ns = time.perf_counter_ns()
+
+    def advance(self, ns):
+        self.ns += int(ns)
+        if self.until_ns is not None and self.ns >= self.until_ns:
+            raise SimulationDone()
+
+    def now_ns(self):
+        delta = self.read_ns
+        if self.cost_scale:
+            host_ns = time.perf_counter_ns()
+            delta += int((host_ns - self._host_ns) * self.cost_scale)
+            self._host_ns = host_ns
+        if delta:
+            self.advance(delta)
+        return self.ns
+
+    def monotonic(self):
+        return self.now_ns() / 1e9
+
+    def sleep(self, seconds):
+        self.advance(seconds * 1e9)
+
+
+clock = VirtualClock()
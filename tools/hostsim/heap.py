@@ -0,0 +1,62 @@
+"""gc.mem_alloc/mem_free for the host, counted with tracemalloc.
+
+On the device nothing is freed until a collection, so mem_alloc() only
+grows between gc.collect() calls. Here objects are freed as soon as they
+are unused, so mem_alloc() adds up tracemalloc's peak over what was live at
+the previous call instead, and only drops on gc.collect(). Without
+tracemalloc tracing (simulate.py --memory starts it) nothing is counted.
+
+CPython allocates things MicroPython doesn't, like every int above 256,
+so host numbers are an upper bound: use them to find what allocates, not
+how much.
+"""
+import gc
+import tracemalloc
+
+HEAP_SIZE = 4 * 1024 * 1024  # host objects are several times bigger, watch mem_free() for growth only
+
+_collect = gc.collect
+
+
+class Heap:
+    def __init__(self, size=HEAP_SIZE):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self._origin = tracemalloc.get_traced_memory()[0]  # the host's own objects don't count
+        self._base = 0  # live bytes after the last collection
+        self._allocated = 0  # bytes allocated since then
+        self._last = self._origin  # live bytes at the previous read
+        self._overhead = 0
+        if tracemalloc.is_tracing():
+            # what two reads in a row count, the bookkeeping itself
+            self.mem_alloc()
+            self._overhead = -self.mem_alloc() + self.mem_alloc()
+
+    def _update(self):
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self._allocated += max(0, peak - self._last - self._overhead)
+        self._last = current
+
+    def mem_alloc(self):
+        self._update()
+        return self._base + self._allocated
+
+    def mem_free(self):
+        return max(0, self.size - self.mem_alloc())
+
+    def collect(self):
+        result = _collect()
+        if tracemalloc.is_tracing():
+            self._last = tracemalloc.get_traced_memory()[0]
+            self._base = max(0, self._last - self._origin)
+            tracemalloc.reset_peak()
+        self._allocated = 0
+        return result
+
+
+heap = Heap()
@@ -0,0 +1,18 @@
+"""Stand-in for `adafruit_74hc595`. Every gpio assignment is one SPI transfer"""
+
+
+class ShiftRegister74HC595:
+    def __init__(self, spi, latch, number_of_shift_registers=1):
+        self._spi = spi
+        self._latch = latch
+        self._gpio = bytearray(number_of_shift_registers)
+        self.number_of_shift_registers = number_of_shift_registers
+
+    @property
+    def gpio(self):
+        return self._gpio
+
+    @gpio.setter
+    def gpio(self, val):
+        self._gpio[:] = val
+        self._spi.write(self._gpio)
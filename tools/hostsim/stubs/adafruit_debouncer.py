@@ -0,0 +1,28 @@
+"""Stand-in for `adafruit_debouncer.Debouncer` (edge detection without the bounce filter)"""
+
+
+class Debouncer:
+    def __init__(self, io_or_predicate, interval=0.010):
+        if callable(io_or_predicate):
+            self._read = io_or_predicate
+        else:
+            self._read = lambda: io_or_predicate.value
+        self.interval = interval
+        self._value = self._read()
+        self._last = self._value
+
+    def update(self):
+        self._last = self._value
+        self._value = self._read()
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def rose(self):
+        return self._value and not self._last
+
+    @property
+    def fell(self):
+        return self._last and not self._value
@@ -0,0 +1,24 @@
+"""Stand-in for `adafruit_ticks`, reading the virtual clock"""
+from hostsim.clock import clock
+
+_TICKS_PERIOD = 1 << 29
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return (clock.now_ns() // 1_000_000) & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    diff = ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+    return diff
+
+
+def ticks_less(ticks1, ticks2):
+    return ticks_diff(ticks2, ticks1) < 0
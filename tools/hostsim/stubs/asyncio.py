@@ -0,0 +1,96 @@
+"""Stand-in for CircuitPython's `asyncio`, scheduled on the virtual clock.
+
+Only what runtime.py uses: create_task, sleep/sleep_ms, gather and run.
+A sleeping task wakes once the virtual clock reaches its deadline, and when
+no task is ready the clock jumps straight to the next one. Every task
+resume costs TASK_NS of virtual time, standing in for the scheduler pass
+on the device. Exceptions from any task end run(), SimulationDone included.
+"""
+import heapq
+
+from hostsim.clock import clock
+
+TASK_NS = 20_000
+
+_ready = []  # heap of (wake ns, order, task)
+_order = 0
+_current = None  # task being stepped
+
+
+class _Park:
+    """Suspend the current task until something reschedules it"""
+
+    def __await__(self):
+        yield None
+
+
+class _Sleep:
+    def __init__(self, ns):
+        self.ns = ns
+
+    def __await__(self):
+        yield clock.ns + self.ns
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+        self._waiters = []
+        _schedule(self, clock.ns)
+
+    def _step(self):
+        try:
+            wake = self.coro.send(None)
+        except StopIteration as e:
+            self.done = True
+            self.result = e.value
+            for waiter in self._waiters:
+                _schedule(waiter, clock.ns)
+            return
+        if wake is not None:
+            _schedule(self, wake)
+
+    def __await__(self):
+        while not self.done:
+            self._waiters.append(_current)
+            yield from _Park().__await__()
+        return self.result
+
+
+def _schedule(task, wake_ns):
+    global _order
+    _order += 1
+    heapq.heappush(_ready, (wake_ns, _order, task))
+
+
+def create_task(coro):
+    return Task(coro)
+
+
+def sleep(seconds):
+    return _Sleep(int(seconds * 1e9))
+
+
+def sleep_ms(ms):
+    return _Sleep(int(ms) * 1_000_000)
+
+
+async def gather(*tasks):
+    return [await task for task in tasks]
+
+
+def run(coro):
+    global _current
+    _ready.clear()
+    main = Task(coro)
+    while _ready and not main.done:
+        wake, _, task = heapq.heappop(_ready)
+        if wake > clock.ns:
+            clock.advance(wake - clock.ns)
+        _current = task
+        task._step()
+        clock.advance(TASK_NS)
+    _current = None
+    return main.result
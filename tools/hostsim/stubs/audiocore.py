@@ -0,0 +1,26 @@
+"""Stand-in for `audiocore`. WaveFile reads the header like the real one"""
+import wave
+
+
+class WaveFile:
+    def __init__(self, file, buffer=None):
+        with wave.open(file) as wav:
+            self.sample_rate = wav.getframerate()
+            self.channel_count = wav.getnchannels()
+            self.bits_per_sample = wav.getsampwidth() * 8
+            self.frames = wav.getnframes()
+        self.file = file
+
+    def deinit(self):
+        self.file.close()
+
+
+class RawSample:
+    def __init__(self, buffer, *, channel_count=1, sample_rate=8000, single_buffer=True):
+        self.buffer = buffer
+        self.channel_count = channel_count
+        self.sample_rate = sample_rate
+        self.bits_per_sample = buffer.itemsize * 8 if hasattr(buffer, "itemsize") else 8
+
+    def deinit(self):
+        pass
@@ -0,0 +1,50 @@
+"""Stand-in for `audiomixer`. Voices count plays and level writes"""
+
+
+class MixerVoice:
+    def __init__(self):
+        self._level = 1.0
+        self.sample = None
+        self.playing = False
+        self.plays = 0
+        self.level_writes = 0
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        self.level_writes += 1
+        self._level = value
+
+    def play(self, sample, *, loop=False):
+        self.sample = sample
+        self.playing = True
+        self.plays += 1
+
+    def stop(self):
+        self.playing = False
+
+
+class Mixer:
+    def __init__(self, *, voice_count=2, buffer_size=1024, channel_count=2,
+                 bits_per_sample=16, samples_signed=True, sample_rate=8000):
+        self.voice = tuple(MixerVoice() for _ in range(voice_count))
+        self.voice_count = voice_count
+        self.channel_count = channel_count
+        self.bits_per_sample = bits_per_sample
+        self.sample_rate = sample_rate
+
+    @property
+    def playing(self):
+        return any(voice.playing for voice in self.voice)
+
+    def play(self, sample, *, voice=0, loop=False):
+        self.voice[voice].play(sample, loop=loop)
+
+    def stop_voice(self, voice=0):
+        self.voice[voice].stop()
+
+    def deinit(self):
+        pass
@@ -0,0 +1,18 @@
+"""Stand-in for `audiopwmio`"""
+
+
+class PWMAudioOut:
+    def __init__(self, left_channel, *, right_channel=None, quiescent_value=0x8000):
+        self.pin = left_channel
+        self.playing = False
+        self.source = None
+
+    def play(self, sample, *, loop=False):
+        self.source = sample
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
+
+    def deinit(self):
+        pass
@@ -0,0 +1,18 @@
+"""Stand-in for `board`: any GPxx attribute is a named pin"""
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+_pins = {}
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return _pins.setdefault(name, Pin(name))
@@ -0,0 +1,27 @@
+"""Stand-in for `countio`. Scripts add clock pulses with `pulse()`"""
+
+
+class Edge:
+    RISE = "rise"
+    FALL = "fall"
+    RISE_AND_FALL = "rise_and_fall"
+
+
+counters = {}
+
+
+class Counter:
+    def __init__(self, pin, edge=Edge.FALL, pull=None):
+        self.pin = pin
+        self.edge = edge
+        self.count = 0
+        counters[pin.name] = self
+
+    def pulse(self, n=1):
+        self.count += n
+
+    def reset(self):
+        self.count = 0
+
+    def deinit(self):
+        counters.pop(self.pin.name, None)
@@ -0,0 +1,45 @@
+"""Stand-in for `digitalio`. Inputs default to the pulled-up (released) level.
+
+Every DigitalInOut is kept in `pins` by pin name so a script can press a
+button with `digitalio.pins["GP21"].value = False`.
+"""
+
+
+class Direction:
+    INPUT = "input"
+    OUTPUT = "output"
+
+
+class Pull:
+    UP = "up"
+    DOWN = "down"
+
+
+pins = {}
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.value = True
+        self.writes = 0
+        pins[pin.name] = self
+
+    def __setattr__(self, name, value):
+        if name == "value" and getattr(self, "direction", None) == Direction.OUTPUT:
+            object.__setattr__(self, "writes", self.writes + 1)
+        object.__setattr__(self, name, value)
+
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+        self.pull = pull
+        self.value = pull != Pull.DOWN
+
+    def switch_to_output(self, value=False):
+        self.direction = Direction.OUTPUT
+        self.value = value
+
+    def deinit(self):
+        pins.pop(self.pin.name, None)
@@ -0,0 +1,72 @@
+"""Stand-in for `keypad`. Scripts press keys with `Keys.set(key_number, pressed)`"""
+from hostsim.clock import clock
+
+keys = []
+
+
+class Event:
+    def __init__(self, key_number=0, pressed=True):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = 0
+
+    @property
+    def released(self):
+        return not self.pressed
+
+
+class EventQueue:
+    def __init__(self, max_events=64):
+        self._events = []
+        self.max_events = max_events
+        self.overflowed = False
+
+    def __len__(self):
+        return len(self._events)
+
+    def __bool__(self):
+        return bool(self._events)
+
+    def _put(self, key_number, pressed):
+        if len(self._events) >= self.max_events:
+            self.overflowed = True
+            return
+        self._events.append((key_number, pressed, clock.ns // 1_000_000))
+
+    def get(self):
+        if not self._events:
+            return None
+        event = Event()
+        self.get_into(event)
+        return event
+
+    def get_into(self, event):
+        if not self._events:
+            return False
+        event.key_number, event.pressed, event.timestamp = self._events.pop(0)
+        return True
+
+    def clear(self):
+        self._events.clear()
+        self.overflowed = False
+
+
+class Keys:
+    def __init__(self, pins, *, value_when_pressed, pull=True, interval=0.02, max_events=64):
+        self.pins = tuple(pins)
+        self.key_count = len(self.pins)
+        self.events = EventQueue(max_events)
+        self._pressed = [False] * self.key_count
+        keys.append(self)
+
+    def set(self, key_number, pressed):
+        """what the background scan would see, queues an event on change"""
+        if self._pressed[key_number] != pressed:
+            self._pressed[key_number] = pressed
+            self.events._put(key_number, pressed)
+
+    def reset(self):
+        self._pressed = [False] * self.key_count
+
+    def deinit(self):
+        keys.remove(self)
@@ -0,0 +1,39 @@
+"""Stand-in for `neopixel`. Counts full strip refreshes in `shows`"""
+
+
+class NeoPixel:
+    def __init__(self, pin, n, *, bpp=3, brightness=1.0, auto_write=True, pixel_order=None):
+        self.pin = pin
+        self.n = n
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self._pixels = [(0, 0, 0)] * n
+        self.shows = 0
+
+    def __len__(self):
+        return self.n
+
+    @staticmethod
+    def _color(value):
+        if isinstance(value, int):
+            return (value >> 16 & 0xFF, value >> 8 & 0xFF, value & 0xFF)
+        return tuple(value)
+
+    def __setitem__(self, index, value):
+        self._pixels[index] = self._color(value)
+        if self.auto_write:
+            self.show()
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def fill(self, color):
+        self._pixels = [self._color(color)] * self.n
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        self.shows += 1
+
+    def deinit(self):
+        pass
@@ -0,0 +1,14 @@
+"""Stand-in for `rotaryio`. Scripts turn the knob by changing `position`"""
+
+encoders = []
+
+
+class IncrementalEncoder:
+    def __init__(self, pin_a, pin_b, divisor=4):
+        self.pins = (pin_a, pin_b)
+        self.divisor = divisor
+        self.position = 0
+        encoders.append(self)
+
+    def deinit(self):
+        encoders.remove(self)
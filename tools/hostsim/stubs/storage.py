@@ -0,0 +1,7 @@
+"""Stand-in for `storage`"""
+
+readonly = False
+
+
+def remount(mount_path, readonly=False, *, disable_concurrent_write_protection=False):
+    globals()["readonly"] = readonly
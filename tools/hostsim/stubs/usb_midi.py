@@ -0,0 +1,34 @@
+"""Stand-in for `usb_midi`. PortOut records writes, PortIn replays fed bytes"""
+
+
+class PortIn:
+    def __init__(self):
+        self._pending = bytearray()
+
+    def feed(self, data):
+        self._pending.extend(data)
+
+    def read(self, nbytes=None):
+        nbytes = len(self._pending) if nbytes is None else nbytes
+        data = bytes(self._pending[:nbytes])
+        del self._pending[:nbytes]
+        return data
+
+    def readinto(self, buf, nbytes=None):
+        data = self.read(len(buf) if nbytes is None else nbytes)
+        buf[:len(data)] = data
+        return len(data)
+
+
+class PortOut:
+    def __init__(self):
+        self.writes = 0
+        self.log = bytearray()
+
+    def write(self, buf):
+        self.writes += 1
+        self.log.extend(buf)
+        return len(buf)
+
+
+ports = (PortIn(), PortOut())
@@ -0,0 +1,238 @@
+"""Export stored sequences and chains as Standard MIDI Files.
+
+    python tools/midiexport.py --slot 0 --tempo 90 --bars 4 -o slot0.mid
+    python tools/midiexport.py --all --tempo 90 --tempo 120 --bars 4 --bars 8 --out-dir midi/
+    python tools/midiexport.py --chain 0:4,1:2 --tempo 100 --type 1 -o song.mid
+
+Notes come from the firmware itself: EuclideanSequencer plays the steps
+and MIDI.trigger_notes turns them into messages, the same channel = voice,
+note = voice mapping and gate lengths as over USB. Messages are written as
+they come, with delta times, only the track length is patched in at the
+end. Type 0 puts everything in one track, type 1 writes a tempo track and
+one track per voice. --all writes every stored slot at every --tempo and
+--bars in one run.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import hostsim
+
+PPQN = 96  # ticks per quarter note
+STEPS_PER_BEAT = 4
+
+
+def load_slots(path, channels):
+    """Slots from sequences.json or a binary sequences.bin store"""
+    hostsim.install()
+    import store
+
+    if path.endswith(".json"):
+        with open(path) as f:
+            return [store.from_json(entry, channels) for entry in json.load(f)]
+    return store.SequenceStore(path, channels=channels, json_path=None).load()
+
+
+def parse_chain(text):
+    """"0:4,1:2" to [(0, 4), (1, 2)]"""
+    chain = []
+    for entry in text.split(","):
+        slot, _, bars = entry.partition(":")
+        chain.append((int(slot), int(bars or 1)))
+    return chain
+
+
+class Capture:
+    """MIDI out that keeps one step worth of bytes"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, buf):
+        self.buf.extend(buf)
+        return len(buf)
+
+
+def step_messages(slots, channels, steps, slot=0, chain=None, gate_steps=2, step_count=16):
+    """(step, message) for every message the firmware sends in `steps` steps,
+    note offs for what still sounds come at step `steps`"""
+    hostsim.install()
+    import event
+    import sequencer
+    from midi import MIDI
+
+    seq = sequencer.EuclideanSequencer(channels=channels, step_count=step_count)
+    seq.sequences = list(slots) + [None] * (sequencer.MAX_SEQUENCES - len(slots))
+    midi = MIDI(channels=channels, gate_steps=gate_steps, running_status=False)
+    midi.midi_out = out = Capture()
+    seq.register(event.SEQ_STEP_TRIGGER_MIDI, midi.trigger_notes)
+    seq.compile()
+
+    if chain:
+        seq.set_chain(chain)
+    else:
+        seq.sequence_idx = seq.next_sequence_idx = slot
+        seq.load_sequence()
+
+    for step in range(steps + 1):
+        if step < steps:
+            seq.i = step % step_count
+            seq.trigger_step()
+        else:
+            midi.release()
+        buf = out.buf
+        for idx in range(0, len(buf), 3):  # no running status, three bytes each
+            yield step, bytes(buf[idx:idx + 3])
+        out.buf = bytearray()
+
+
+def varlen(value):
+    """MIDI variable length quantity"""
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.insert(0, value & 0x7F | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+class SMFWriter:
+    """Writes a Standard MIDI File to a seekable file, one track at a time.
+
+    Events go straight to the file with their delta time, end_track()
+    seeks back to fill in the chunk length.
+    """
+
+    def __init__(self, f, file_type, tracks, division=PPQN):
+        self.f = f
+        self._length_at = None
+        self._tick = 0
+        f.write(b"MThd" + struct.pack(">IHHH", 6, file_type, tracks, division))
+
+    def start_track(self, name=None):
+        self.f.write(b"MTrk")
+        self._length_at = self.f.tell()
+        self.f.write(bytes(4))
+        self._tick = 0
+        if name:
+            self.meta(0, 0x03, name.encode())
+
+    def event(self, tick, data):
+        self.f.write(varlen(tick - self._tick) + data)
+        self._tick = tick
+
+    def meta(self, tick, kind, data):
+        self.event(tick, bytes((0xFF, kind)) + varlen(len(data)) + data)
+
+    def tempo(self, tick, bpm):
+        self.meta(tick, 0x51, round(60_000_000 / bpm).to_bytes(3, "big"))
+
+    def time_signature(self, tick, numerator=4, denominator=4):
+        # denominator as a power of 2, 24 clocks per metronome click, 8 32nds per quarter
+        self.meta(tick, 0x58, bytes((numerator, denominator.bit_length() - 1, 24, 8)))
+
+    def end_track(self, tick=None):
+        self.meta(self._tick if tick is None else max(tick, self._tick), 0x2F, b"")
+        end = self.f.tell()
+        self.f.seek(self._length_at)
+        self.f.write(struct.pack(">I", end - self._length_at - 4))
+        self.f.seek(end)
+
+
+def export(path, slots, channels, tempo, bars, file_type=0, slot=0, chain=None, note_base=0,
+           gate_steps=2, step_count=16):
+    """Write one .mid file, returns the number of note events"""
+    steps = bars * step_count
+    step_ticks = PPQN // STEPS_PER_BEAT
+    end_tick = steps * step_ticks
+    name = f"slot {slot}" if not chain else "chain " + ",".join(f"{s}:{b}" for s, b in chain)
+
+    def messages():
+        return step_messages(slots, channels, steps, slot, chain, gate_steps, step_count)
+
+    def note(msg):
+        return bytes((msg[0], min(msg[1] + note_base, 127), msg[2]))
+
+    notes = 0
+    with open(path, "wb") as f:
+        if file_type == 0:
+            smf = SMFWriter(f, 0, 1)
+            smf.start_track(name)
+            smf.tempo(0, tempo)
+            smf.time_signature(0)
+            for step, msg in messages():
+                smf.event(step * step_ticks, note(msg))
+                notes += 1
+            smf.end_track(end_tick)
+            return notes
+
+        smf = SMFWriter(f, 1, channels + 1)
+        smf.start_track(name)
+        smf.tempo(0, tempo)
+        smf.time_signature(0)
+        smf.end_track(end_tick)
+        for ch in range(channels):
+            # one run of the sequencer per track, nothing is kept between tracks
+            smf.start_track(f"voice {ch + 1}")
+            for step, msg in messages():
+                if msg[0] & 0x0F == ch:
+                    smf.event(step * step_ticks, note(msg))
+                    notes += 1
+            smf.end_track(end_tick)
+    return notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequences", default=os.path.join(hostsim.SRC, "sequences.json"),
+                        help="sequences.json or a sequences.bin copied from the device")
+    parser.add_argument("--slot", type=int, default=0, help="slot to export (0-15)")
+    parser.add_argument("--all", action="store_true", help="export every stored slot")
+    parser.add_argument("--chain", help="export a song instead, slot:bars entries like 0:4,1:2")
+    parser.add_argument("--tempo", type=float, action="append", help="BPM, repeat for several exports")
+    parser.add_argument("--bars", type=int, action="append",
+                        help="bars per export, repeat for several (a chain plays once through by default)")
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--type", type=int, choices=(0, 1), default=0, help="SMF type")
+    parser.add_argument("--gate", type=int, default=2, help="note length in steps, like MIDI.gate_steps")
+    parser.add_argument("--note-base", type=int, default=0,
+                        help="added to the note numbers (voice = note on the device), e.g. 36 for drum maps")
+    parser.add_argument("-o", "--output", help="output file for a single export")
+    parser.add_argument("--out-dir", default=".", help="output folder for batch exports")
+    args = parser.parse_args()
+
+    slots = load_slots(args.sequences, args.channels)
+    chain = parse_chain(args.chain) if args.chain else None
+    tempos = args.tempo or [90]
+    bar_counts = args.bars or [sum(bars for _, bars in chain) if chain else 4]
+    if chain:
+        indexes = [None]
+    elif args.all:
+        indexes = [idx for idx, sequence in enumerate(slots) if sequence is not None]
+    else:
+        indexes = [args.slot]
+    single = len(indexes) * len(tempos) * len(bar_counts) == 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    started = time.perf_counter()
+    files = notes = 0
+    for idx in indexes:
+        for tempo in tempos:
+            for bars in bar_counts:
+                if args.output and single:
+                    path = args.output
+                else:
+                    prefix = "chain" if chain else f"slot{idx:02d}"
+                    path = os.path.join(args.out_dir, f"{prefix}-{tempo:g}bpm-{bars}bars.mid")
+                notes += export(path, slots, args.channels, tempo, bars, args.type, idx or 0, chain,
+                                args.note_base, args.gate)
+                files += 1
+    elapsed = time.perf_counter() - started
+    print(f"{files} files, {notes} note events in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
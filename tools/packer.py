@@ -0,0 +1,168 @@
+"""Condition a folder of WAVs into a sample pack the mixer plays as it is.
+
+    python tools/packer.py ~/samples/909 src/samplepack/909
+    python tools/packer.py src/samplepack/dr55 src/samplepack/dr55 --normalize sample
+    python tools/packer.py ~/samples/909 out/909 --rate 22050 --threshold-db -54
+
+Every WAV (8, 16, 24 or 32-bit PCM, any rate and channel count) is mixed
+down to mono, resampled with a windowed sinc to --rate, trimmed of the
+silence before its first and after its last sample above --threshold-db,
+with a short fade out, normalized and written as 16-bit mono with nothing
+but the fmt and data chunks. The output folder gets a manifest.json with
+the format and every sample's length and peak level, in playback order:
+SampleCache refuses packs without one, or packed for another format.
+
+Normalization scales to --peak-db either the whole pack by one gain
+(default, keeps the balance between the sounds) or every sample on its own.
+The input and output folder may be the same.
+"""
+import argparse
+import array
+import json
+import math
+import os
+import sys
+import wave
+
+SAMPLE_RATE = 22500  # same as main.py
+MANIFEST = "manifest.json"  # same as samples.py
+SINC_ZEROS = 16  # zero crossings each side of the resampling kernel
+FADE_MS = 3
+
+
+def read_wav(path):
+    """(mono float samples in [-1, 1], rate)"""
+    with wave.open(path) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    if sys.byteorder == "big" and width in (2, 4):
+        raise ValueError("big endian hosts are not supported")
+
+    if width == 1:
+        values = [(b - 128) / 128 for b in data]
+    elif width == 2:
+        values = [v / 32768 for v in array.array("h", data)]
+    elif width == 3:
+        values = [int.from_bytes(data[i:i + 3], "little", signed=True) / 8388608 for i in range(0, len(data), 3)]
+    elif width == 4:
+        values = [v / 2147483648 for v in array.array("i", data)]
+    else:
+        raise ValueError(f"{path}: {width * 8}-bit samples are not supported")
+
+    if channels > 1:
+        values = [sum(values[i:i + channels]) / channels for i in range(0, len(values), channels)]
+    return values, rate
+
+
+def resample(values, rate, target):
+    """Hann windowed sinc interpolation, low passed below the lower Nyquist"""
+    if rate == target or not values:
+        return values
+    ratio = target / rate
+    cutoff = min(1.0, ratio)  # of the source Nyquist
+    half = SINC_ZEROS / cutoff  # kernel half width in source samples
+    out = []
+    for n in range(int(len(values) * ratio)):
+        center = n / ratio
+        lo, hi = max(0, math.ceil(center - half)), min(len(values) - 1, math.floor(center + half))
+        total = 0.0
+        for i in range(lo, hi + 1):
+            x = i - center
+            window = 0.5 + 0.5 * math.cos(math.pi * x / half)
+            arg = math.pi * x * cutoff
+            total += values[i] * window * (cutoff if arg == 0 else math.sin(arg) / arg * cutoff)
+        out.append(total)
+    return out
+
+
+def trim(values, rate, threshold_db):
+    """Cut the silence at both ends, fading out the last FADE_MS"""
+    threshold = 10 ** (threshold_db / 20)
+    loud = [i for i, v in enumerate(values) if abs(v) > threshold]
+    if not loud:
+        return []
+    values = values[loud[0]:loud[-1] + 1]
+    fade = min(len(values), int(rate * FADE_MS / 1000))
+    for i in range(fade):
+        values[len(values) - fade + i] *= 1 - (i + 1) / (fade + 1)
+    return values
+
+
+def peak(values):
+    return max((abs(v) for v in values), default=0.0)
+
+
+def to_int16(values, gain):
+    return array.array("h", (max(-32768, min(32767, round(v * gain * 32768))) for v in values))
+
+
+def write_wav(path, data, rate):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(data.tobytes())
+
+
+def pack(src, dst, rate=SAMPLE_RATE, threshold_db=-60.0, peak_db=-1.0, normalize="pack"):
+    """Condition every WAV of src into dst, returns the manifest"""
+    filenames = sorted(f for f in os.listdir(src) if f.lower().endswith(".wav") and not f.startswith("."))
+    if not filenames:
+        raise ValueError(f"{src}: no WAV files")
+
+    sounds = []
+    for filename in filenames:
+        values, source_rate = read_wav(os.path.join(src, filename))
+        values = trim(resample(values, source_rate, rate), rate, threshold_db)
+        if not values:
+            print(f"{filename}: silent, skipped", file=sys.stderr)
+            continue
+        sounds.append((filename, values))
+
+    if not sounds:
+        raise ValueError(f"{src}: only silent WAV files")
+    target = 10 ** (peak_db / 20)
+    pack_gain = target / max(peak(values) for _, values in sounds)
+    os.makedirs(dst, exist_ok=True)
+    samples = []
+    for filename, values in sounds:
+        gain = target / peak(values) if normalize == "sample" else pack_gain if normalize == "pack" else 1.0
+        data = to_int16(values, gain)
+        write_wav(os.path.join(dst, filename), data, rate)
+        top = max(abs(v) for v in data) or 1
+        samples.append({
+            "file": filename,
+            "frames": len(data),
+            "bytes": len(data) * 2,
+            "peak_db": round(20 * math.log10(top / 32768), 2),
+        })
+
+    manifest = {"rate": rate, "channels": 1, "bits": 16, "samples": samples}
+    with open(os.path.join(dst, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.write("\n")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("src", help="folder with the WAV files")
+    parser.add_argument("dst", help="pack folder to write, e.g. src/samplepack/<name>")
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE, help="mixer sample rate, SAMPLE_RATE in main.py")
+    parser.add_argument("--threshold-db", type=float, default=-60.0, help="silence below this is trimmed")
+    parser.add_argument("--peak-db", type=float, default=-1.0, help="normalized peak level")
+    parser.add_argument("--normalize", choices=("pack", "sample", "off"), default="pack",
+                        help="one gain for the whole pack, one per sample, or none")
+    args = parser.parse_args()
+
+    before = sum(os.path.getsize(os.path.join(args.src, f)) for f in os.listdir(args.src)
+                 if f.lower().endswith(".wav"))
+    manifest = pack(args.src, args.dst, args.rate, args.threshold_db, args.peak_db, args.normalize)
+    for sample in manifest["samples"]:
+        print(f"{sample['file']:<32} {sample['frames']:>7} frames {sample['peak_db']:>7.2f} dBFS")
+    after = sum(sample["bytes"] for sample in manifest["samples"])
+    print(f"{len(manifest['samples'])} samples, {before} B of WAV files -> {after} B of sample data", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Render stored sequences to WAV files offline, much faster than real time.
+
+    python tools/render.py --slot 0 --tempo 90 --bars 4 -o slot0.wav
+    python tools/render.py --all --tempo 90 --tempo 120 --out-dir renders/
+
+Patterns come from EuclideanSequencer itself and the tracks share the
+mixer voices through the firmware's VoicePool, stealing included. Samples
+are mapped to tracks in manifest order like SampleCache does, every voice
+plays until its sample ends or the voice is taken over, at a fixed level,
+voices are summed and clipped to 16 bits. With --all every stored slot is
+rendered, empty ones are skipped. Requires numpy.
+"""
+import argparse
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+import hostsim
+from midiexport import load_slots
+
+VOICE_LEVEL = 0.8  # same as the VoicePool level in main
+SAMPLE_RATE = 22500
+TRACKS = 8  # same as main
+MAX_VOICES = 4  # same as main
+
+
+def load_samplepack(folder, tracks):
+    """Sample per track as float32 arrays in [-1, 1], in manifest order and
+    wrapping around like SampleCache.swap(), and the sample rate"""
+    hostsim.install()
+    from samples import SampleCache
+
+    folder = os.path.normpath(folder)
+    cache = SampleCache(tracks, SAMPLE_RATE, folder=os.path.dirname(folder))
+    filenames = cache.filenames(os.path.basename(folder))  # refuses packs the firmware refuses
+    loaded = {}
+    for filename in filenames:
+        with wave.open(os.path.join(folder, filename)) as wav:
+            data = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+            loaded[filename] = (data / 32768.0).astype(np.float32)
+    return [loaded[filenames[idx % len(filenames)]] for idx in range(tracks)], SAMPLE_RATE
+
+
+class RenderVoice:
+    """audiomixer voice stand-in that keeps what it played, as (start frame, sample, level)"""
+
+    def __init__(self, mixer):
+        self.mixer = mixer
+        self.level = 1.0
+        self.plays = []
+
+    @property
+    def playing(self):
+        if not self.plays:
+            return False
+        start, sample, _ = self.plays[-1]
+        return self.mixer.frame < start + len(sample)
+
+    def play(self, sample, loop=False):
+        self.plays.append((self.mixer.frame, sample, self.level))
+
+
+class RenderMixer:
+    def __init__(self, voices):
+        self.frame = 0  # where the step being triggered starts
+        self.voice = [RenderVoice(self) for _ in range(voices)]
+
+
+def slot_patterns(slots, channels, step_count=16):
+    """(slot count, channels) array of pattern bitmasks via EuclideanSequencer"""
+    hostsim.install()
+    import sequencer
+
+    seq = sequencer.EuclideanSequencer(channels=channels, step_count=step_count)
+    seq.sequences = slots
+    patterns = np.zeros((len(slots), channels), dtype=np.uint64)
+    for idx in range(len(slots)):
+        seq.sequence_idx = idx
+        seq.reset()
+        seq.load_sequence()
+        patterns[idx] = seq.patterns
+    return patterns
+
+
+def render(patterns, samples, rate, tempo, bars, voices=MAX_VOICES, step_count=16):
+    """Mix patterns of shape (n, channels) into int16 audio of shape (n, frames)"""
+    hostsim.install()
+    from voices import VoicePool
+
+    n, channels = patterns.shape
+    steps = bars * step_count
+    step_frames = 60 * rate / 4 / tempo
+    onsets = np.round(np.arange(steps) * step_frames).astype(np.int64)
+    tail = max(len(s) for s in samples)
+    frames = int(round(steps * step_frames)) + tail
+
+    mix = np.zeros((n, frames), dtype=np.float32)
+    for row in range(n):
+        # the device's voice allocation, step by step
+        mixer = RenderMixer(voices)
+        pool = VoicePool(mixer, channels, level=VOICE_LEVEL)
+        row_patterns = [int(pattern) for pattern in patterns[row]]
+        for step in range(steps):
+            mixer.frame = int(onsets[step])
+            bit = step % step_count
+            pool.trigger(bytes(pattern >> bit & 1 for pattern in row_patterns), samples)
+
+        # then every play lasts until its sample ends or the next play on its voice
+        for voice in mixer.voice:
+            plays = voice.plays + [(frames, None, 0)]
+            for (start, sample, level), (end, _, _) in zip(plays, plays[1:]):
+                length = min(len(sample), end - start)
+                mix[row, start:start + length] += sample[:length] * level
+
+    return np.clip(np.round(mix * 32767), -32768, 32767).astype("<i2")
+
+
+def write_wav(path, audio, rate):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(audio.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequences", default=os.path.join(hostsim.SRC, "sequences.json"),
+                        help="sequences.json or a sequences.bin copied from the device")
+    parser.add_argument("--samplepack", default=os.path.join(hostsim.SRC, "samplepack", "dr55"),
+                        help="samplepack/<name> folder")
+    parser.add_argument("--slot", type=int, default=0, help="slot to render (0-15)")
+    parser.add_argument("--all", action="store_true", help="render every stored slot")
+    parser.add_argument("--tempo", type=float, action="append", help="BPM, repeat for several renders")
+    parser.add_argument("--bars", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=TRACKS, help="tracks, TRACKS in main.py")
+    parser.add_argument("--voices", type=int, default=MAX_VOICES, help="mixer voices, MAX_VOICES in main.py")
+    parser.add_argument("-o", "--output", help="output file for a single render")
+    parser.add_argument("--out-dir", default=".", help="output folder for batch renders")
+    args = parser.parse_args()
+
+    tempos = args.tempo or [90]
+    slots = load_slots(args.sequences, args.channels)
+    indexes = [idx for idx, sequence in enumerate(slots) if sequence is not None] if args.all else [args.slot]
+    if not indexes:
+        sys.exit(f"{args.sequences}: no stored sequences")
+    samples, rate = load_samplepack(args.samplepack, args.channels)
+    patterns = slot_patterns(slots, args.channels)[indexes]
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    started = time.perf_counter()
+    audio_seconds = 0.0
+    for tempo in tempos:
+        audio = render(patterns, samples, rate, tempo, args.bars, args.voices)
+        for idx, row in zip(indexes, audio):
+            if args.output and len(indexes) == 1 and len(tempos) == 1:
+                path = args.output
+            else:
+                path = os.path.join(args.out_dir, f"slot{idx:02d}-{tempo:g}bpm.wav")
+            write_wav(path, row, rate)
+            audio_seconds += len(row) / rate
+            print(path)
+
+    elapsed = time.perf_counter() - started
+    print(f"rendered {audio_seconds:.1f}s of audio in {elapsed:.2f}s "
+          f"({audio_seconds / elapsed:.0f}x real time)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Run src/main.py headless on the host against a virtual clock.
+
+    python tools/simulate.py --seconds 30
+    python tools/simulate.py --seconds 10 --spin 20 --loop-us 800
+
+The firmware runs unmodified on top of the stand-ins in tools/hostsim. Time
+only moves through the virtual clock: --loop-us per main loop pass, --read-us
+per clock read and, with --cost-scale, the host time spent in between scaled
+up to device speed. At the end it reports loop iterations per second, the
+time to the first step, the jitter between consecutive steps and how late
+each step fired against the ideal tempo grid.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import hostsim
+from hostsim.clock import SimulationDone
+
+BUTTON_PINS = ("GP21", "GP20", "GP19", "GP18")
+
+
+class SerialTap:
+    """Counts what the firmware prints, charging each byte to the virtual clock"""
+
+    def __init__(self, clock, ns_per_byte, echo=None):
+        self.clock = clock
+        self.ns_per_byte = ns_per_byte
+        self.echo = echo
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes += len(text)
+        if self.echo:
+            self.echo.write(text)
+        if self.ns_per_byte:
+            self.clock.advance(len(text) * self.ns_per_byte)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Inputs:
+    """Scripted front panel: knob spinning, sync input pulses and USB MIDI clock"""
+
+    def __init__(self, spin=0.0, spin_button=0, clock_in_bpm=0.0, clock_in_ppqn=4,
+                 midi_clock_bpm=0.0, midi_jitter_ms=0.0):
+        self.spin = spin
+        self.spin_button = spin_button
+        self.bpm = clock_in_bpm or midi_clock_bpm
+        self.clock_in_ppqn = clock_in_ppqn  # main.py's SYNC_CLOCK_IN_PPQN is set to match
+        self.pulse_ns = 60e9 / clock_in_bpm / clock_in_ppqn if clock_in_bpm else 0
+        self._pulses = 0
+        self.midi_tick_ns = 60e9 / midi_clock_bpm / 24 if midi_clock_bpm else 0
+        self.midi_jitter_ns = midi_jitter_ms * 1e6
+        self._midi_ticks = 0
+        self._midi_started = False
+        self._random = random.Random(0)
+        self._next_tick_ns = 0.0
+        self.start_ns = None  # first external pulse, the master's grid starts there
+
+    @property
+    def external(self):
+        return bool(self.pulse_ns or self.midi_tick_ns)
+
+    def update(self, now_ns):
+        import countio
+        import digitalio
+        import keypad
+        import rotaryio
+
+        if self.start_ns is None and self.external:
+            self.start_ns = now_ns
+
+        if self.spin and rotaryio.encoders:
+            # sweep back and forth over 32 detents so values do not stick at a limit
+            pin = digitalio.pins.get(BUTTON_PINS[self.spin_button])
+            if pin is not None:
+                pin.value = False
+            for keys in keypad.keys:
+                keys.set(self.spin_button, True)
+            detents = int(now_ns * self.spin / 1e9)
+            lap = detents % 64
+            rotaryio.encoders[0].position = lap if lap < 32 else 64 - lap
+
+        if self.pulse_ns and countio.counters:
+            due = int((now_ns - self.start_ns) // self.pulse_ns) + 1
+            if due > self._pulses:
+                for counter in countio.counters.values():
+                    counter.pulse(due - self._pulses)
+                self._pulses = due
+
+        if self.midi_tick_ns:
+            import usb_midi
+
+            port = usb_midi.ports[0]
+            if not self._midi_started:
+                port.feed(b"\xfa")
+                self._midi_started = True
+            while now_ns >= self._next_tick_ns:
+                port.feed(b"\xf8")
+                self._midi_ticks += 1
+                jitter = self._random.uniform(-1, 1) * self.midi_jitter_ns
+                self._next_tick_ns = self.start_ns + self._midi_ticks * self.midi_tick_ns + jitter
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def stdev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+
+
+def timing_report(step_ns, tempo, seconds, iterations, serial_bytes, wall, start_ns=None, untimed=0):
+    """Step timing against the ideal grid: from the first step, or when
+    externally clocked from the master's first pulse at start_ns, leaving
+    out the first `untimed` steps, played before it (the boot snapshot's)"""
+    period_ns = 60e9 / 4 / tempo
+    first_ns = step_ns[0] if step_ns else None
+    step_ns = step_ns[untimed:]
+    report = {
+        "virtual_seconds": seconds,
+        "wall_seconds": round(wall, 3),
+        "realtime_factor": round(seconds / wall, 1) if wall else None,
+        "loop_iterations": iterations,
+        "loops_per_second": round(iterations / seconds, 1) if seconds else 0,
+        "tempo": tempo,
+        "ideal_step_ms": round(period_ns / 1e6, 3),
+        "steps": len(step_ns),
+        "first_step_ms": round(first_ns / 1e6, 3) if first_ns is not None else None,
+        "serial_bytes": serial_bytes,
+    }
+    if len(step_ns) < 2:
+        return report
+
+    intervals = [(b - a) / 1e6 for a, b in zip(step_ns, step_ns[1:])]
+    mean = sum(intervals) / len(intervals)
+    origin = step_ns[0] if start_ns is None else start_ns
+    lateness = [(t - origin - n * period_ns) / 1e6 for n, t in enumerate(step_ns)]
+    report.update({
+        "interval_mean_ms": round(mean, 3),
+        "jitter_stdev_ms": round(stdev(intervals), 3),
+        "jitter_max_ms": round(max(abs(i - mean) for i in intervals), 3),
+        "late_mean_ms": round(sum(lateness) / len(lateness), 3),
+        "late_p99_ms": round(percentile(lateness, 99), 3),
+        "late_max_ms": round(max(lateness), 3),
+        "late_min_ms": round(min(lateness), 3),
+        "drift_ms": round(lateness[-1], 3),
+    })
+    return report
+
+
+def override_settings(path, settings):
+    """Rewrite `NAME = value` settings at the top level of main.py"""
+    with open(path) as f:
+        lines = f.read().split("\n")
+    for name, value in settings.items():
+        for idx, line in enumerate(lines):
+            if line.startswith(f"{name} = "):
+                lines[idx] = f"{name} = {value!r}"
+                break
+        else:
+            raise ValueError(f"{path}: no {name} setting")
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def simulate(seconds=10.0, loop_us=500.0, read_us=0.0, cost_scale=0.0,
+             serial_us_per_byte=0.0, inputs=None, echo=False, event_stats=False,
+             use_asyncio=True, memory=False, src=hostsim.SRC):
+    clock = hostsim.install(src)
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None and not asyncio.__file__.startswith(hostsim.STUBS):
+        del sys.modules["asyncio"]  # the host's own, the stand-in runs on the virtual clock
+    runtime = sys.modules.get("runtime")
+    if not use_asyncio:
+        sys.modules["runtime"] = None  # main.py falls back to its plain loop
+    workdir = tempfile.mkdtemp(prefix="euclid16-sim-")
+    shutil.copytree(src, workdir, dirs_exist_ok=True)
+    inputs = inputs or Inputs()
+    override_settings(os.path.join(workdir, "main.py"), {"SYNC_CLOCK_IN_PPQN": inputs.clock_in_ppqn})
+
+    import event
+    import interface
+    import sequencer
+
+    event.INSTRUMENT = event_stats
+
+    step_ns = []
+    counters = {"iterations": 0}
+
+    trigger_step = sequencer.EuclideanSequencer.trigger_step
+    ui_classes = [interface.UI] + [cls for cls in interface.UI.__subclasses__()]
+    ui_updates = [cls.update for cls in ui_classes]
+
+    def timed_trigger_step(self):
+        step_ns.append(clock.ns)
+        return trigger_step(self)
+
+    def timed(ui_update):
+        def timed_ui_update(self):
+            counters["iterations"] += 1
+            inputs.update(clock.ns)
+            if inputs.start_ns is not None and "untimed" not in counters:
+                counters["untimed"] = len(step_ns)  # steps before the first external pulse
+            ui_update(self)
+            clock.advance(loop_us * 1000)
+        return timed_ui_update
+
+    sequencer.EuclideanSequencer.trigger_step = timed_trigger_step
+    for cls, ui_update in zip(ui_classes, ui_updates):
+        cls.update = timed(ui_update)
+
+    tap = SerialTap(clock, int(serial_us_per_byte * 1000), echo=sys.stdout if echo else None)
+    namespace = {"__name__": "__main__", "__file__": os.path.join(workdir, "main.py")}
+    with open(namespace["__file__"]) as f:
+        code = compile(f.read(), namespace["__file__"], "exec")
+
+    cwd, stdout = os.getcwd(), sys.stdout
+    os.chdir(workdir)
+    sys.stdout = tap
+    clock.reset(read_ns=int(read_us * 1000), cost_scale=cost_scale, until_ns=int(seconds * 1e9))
+    if memory:
+        tracemalloc.start()
+        hostsim.heap.reset()
+    wall = time.perf_counter()
+    try:
+        exec(code, namespace)
+    except SimulationDone:
+        pass
+    finally:
+        wall = time.perf_counter() - wall
+        if memory:
+            tracemalloc.stop()
+        sys.stdout = stdout
+        os.chdir(cwd)
+        sequencer.EuclideanSequencer.trigger_step = trigger_step
+        for cls, ui_update in zip(ui_classes, ui_updates):
+            cls.update = ui_update
+        shutil.rmtree(workdir, ignore_errors=True)
+        if not use_asyncio:
+            del sys.modules["runtime"]
+            if runtime is not None:
+                sys.modules["runtime"] = runtime
+
+    seq = namespace.get("seq")
+    tempo = seq.tempo if seq is not None else 0
+    start_ns = None
+    if inputs.external:
+        tempo = inputs.bpm  # externally clocked, the grid is the one of the clock source
+        start_ns = inputs.start_ns if inputs.start_ns is not None else clock.ns
+    report = timing_report(step_ns, tempo, clock.ns / 1e9, counters["iterations"], tap.bytes, wall,
+                           start_ns, counters.get("untimed", len(step_ns) if start_ns is not None else 0))
+    report["namespace"] = namespace
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="virtual run time")
+    parser.add_argument("--loop-us", type=float, default=500.0, help="fixed virtual cost of one main loop pass")
+    parser.add_argument("--read-us", type=float, default=0.0, help="virtual cost of every clock read")
+    parser.add_argument("--cost-scale", type=float, default=0.0,
+                        help="charge host time between clock reads, multiplied by this factor")
+    parser.add_argument("--serial-us-per-byte", type=float, default=0.0,
+                        help="virtual cost of every byte printed to the serial console")
+    parser.add_argument("--spin", type=float, default=0.0, help="turn the encoder at this many detents/s")
+    parser.add_argument("--spin-button", type=int, default=0, help="button held while spinning (0-3)")
+    parser.add_argument("--clock-in", type=float, default=0.0, help="feed the sync input at this BPM")
+    parser.add_argument("--clock-in-ppqn", type=int, default=4, help="pulses per quarter note on the sync input, a multiple of 4")
+    parser.add_argument("--midi-clock", type=float, default=0.0, help="send USB MIDI Start and clock at this BPM")
+    parser.add_argument("--midi-jitter-ms", type=float, default=0.0, help="random +/- jitter on every MIDI clock tick")
+    parser.add_argument("--no-asyncio", action="store_true",
+                        help="run main.py's plain loop instead of the asyncio runtime")
+    parser.add_argument("--echo", action="store_true", help="pass firmware prints through")
+    parser.add_argument("--event-stats", action="store_true",
+                        help="instrument event dispatch and list handler time (use with --cost-scale)")
+    parser.add_argument("--memory", action="store_true",
+                        help="count allocations (slow) and report collections and allocating handlers "
+                             "with --event-stats, CPython allocates more than the device")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    inputs = Inputs(args.spin, args.spin_button, args.clock_in, args.clock_in_ppqn,
+                    args.midi_clock, args.midi_jitter_ms)
+    report = simulate(args.seconds, args.loop_us, args.read_us, args.cost_scale,
+                      args.serial_us_per_byte, inputs, args.echo, args.event_stats, not args.no_asyncio,
+                      args.memory)
+    namespace = report.pop("namespace")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>18}: {value}")
+
+    manager = namespace.get("memory")
+    if args.memory and manager is not None:
+        print()
+        manager.report()
+
+    if args.event_stats:
+        for name in ("seq", "ui", "midi"):
+            emitter = namespace.get(name)
+            if emitter is not None and emitter.stats():
+                print(f"\n{name} events:")
+                emitter.print_stats()
+
+
+if __name__ == "__main__":
+    main()
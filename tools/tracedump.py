@@ -0,0 +1,102 @@
+"""Decode the "#T" trace lines the firmware writes to the serial console.
+
+    python tools/tracedump.py capture.log
+    python tools/tracedump.py --port /dev/ttyACM0      (needs pyserial)
+
+Other console output passes through untouched, so this also works as a
+plain serial monitor.
+"""
+import argparse
+import sys
+from binascii import unhexlify
+
+import hostsim
+
+hostsim.install()
+import event  # noqa: E402
+import tracebuf  # noqa: E402
+
+TICKS_PERIOD = 1 << 29  # adafruit_ticks wraps here
+
+
+def describe(code, a, b):
+    if code == tracebuf.STEP:
+        return f"STEP       step={a:<3} late={b}us"
+    if code == tracebuf.EVENT:
+        return f"EVENT      {event.event_name(a)} {b}"
+    if code == tracebuf.LOAD:
+        return f"LOAD       sequence={a}"
+    if code == tracebuf.SAVE_START:
+        return f"SAVE_START sequence={a}"
+    if code == tracebuf.SAVE_END:
+        return f"SAVE_END   sequence={a} ok={b}"
+    if code == tracebuf.PATTERN:
+        return f"PATTERN    ch={a} pattern={b:031b}"
+    if code == tracebuf.TEMPO:
+        return f"TEMPO      bpm={a} step={b}us"
+    if code == tracebuf.SYNC:
+        return f"SYNC       {'external' if a else 'internal'}"
+    if code == tracebuf.PLAY:
+        return f"PLAY       {'playing' if a else 'stopped'}"
+    if code == tracebuf.GC:
+        return f"GC         took={a}us free={b}"
+    if code == tracebuf.ALLOC:
+        return f"ALLOC      step={a:<3} bytes={b}"
+    if code == tracebuf.BOOT:
+        return f"BOOT       stage={a} at={b}ms"
+    return f"CODE{code:<6} a={a} b={b}"
+
+
+class Decoder:
+    def __init__(self, out):
+        self.out = out
+        self._last = None
+        self._epoch = 0
+
+    def _unwrap(self, ticks):
+        if self._last is not None and ticks < self._last - TICKS_PERIOD // 2:
+            self._epoch += TICKS_PERIOD
+        self._last = ticks
+        return self._epoch + ticks
+
+    def feed_line(self, line):
+        line = line.rstrip("\r\n")
+        prefix = tracebuf.LINE_PREFIX.decode()
+        if line.startswith(prefix):
+            for ticks, code, level, a, b in tracebuf.decode(unhexlify(line[len(prefix):])):
+                ms = self._unwrap(ticks)
+                level = "DIW"[level] if level < 3 else "?"
+                self.out.write(f"{ms / 1000:10.3f}s {level} {describe(code, a, b)}\n")
+        elif line.startswith(tracebuf.DROPPED_PREFIX.decode()):
+            self.out.write(f"{'':11} ! {line[len(tracebuf.DROPPED_PREFIX):]} records dropped\n")
+        else:
+            self.out.write(line + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="captured console logs, stdin if none")
+    parser.add_argument("--port", help="read a serial port instead, e.g. /dev/ttyACM0")
+    args = parser.parse_args()
+
+    decoder = Decoder(sys.stdout)
+    if args.port:
+        import serial
+
+        with serial.Serial(args.port, 115200, timeout=1) as port:
+            while True:
+                line = port.readline()
+                if line:
+                    decoder.feed_line(line.decode(errors="replace"))
+                    sys.stdout.flush()
+
+    sources = args.files or ["-"]
+    for name in sources:
+        f = sys.stdin if name == "-" else open(name)
+        with f:
+            for line in f:
+                decoder.feed_line(line)
+
+
+if __name__ == "__main__":
+    main()